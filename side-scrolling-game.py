@@ -1,16 +1,86 @@
 import pygame
+import numpy as np
 import sys
+import os
 import random
+import heapq
 import math
-
-# Initialize Pygame
-pygame.init()
-pygame.mixer.init()
+import time
+import argparse
+import multiprocessing
+import subprocess
+import threading
+import queue
+import struct
+import zlib
+import json
+import csv
+import platform as host
+from collections import deque
 
 # Screen setup
 WIDTH, HEIGHT = 1000, 600
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Animal Hero vs Human Enemies")
+
+# The window and fonts are created by init_display() so the game can also run headless
+screen = None
+font_large = None
+font_medium = None
+font_small = None
+
+# Looking fonts up by name scans every font on the system, so the paths found are
+# cached. A missing font is cached as None, which is pygame's bundled font.
+FONT_NAME = "Arial"
+FONT_CACHE = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser(os.path.join("~", ".cache")),
+                          "animal-hero", "fonts.json")
+
+# Time from launch to the first frame that --startup-check holds the game to
+STARTUP_TARGET_MS = 1000
+STARTUP_RUNS = 5
+
+# Only push the parts of the screen that changed instead of flipping every frame
+DIRTY_RECTS = False
+
+# Levels are JSON files split into chunks that are streamed in around the camera
+LEVEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "levels")
+LEVEL_FILES = ["level1.json", "level2.json", "level3.json"]
+SOUND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sounds")
+STREAM_MARGIN = 500  # extra distance beyond the screen that is kept loaded
+ACTIVE_RADIUS = 1200  # enemies further than this from the player sleep
+CHASE_RADIUS = 400  # normal enemies closer than this start hunting the player, bosses always do
+CHASE_CHECK_STEPS = 2400  # most steps --chase-check gives a hunter to reach the player
+CHASE_CHECK_OFFSETS = [-350, -200, 200, 350]  # where its hunters start on the ground, from the player
+SCALAR_CHECK_REFILL = 200  # steps between top-ups of the --scalar-check crowd
+
+# Enemy type codes used by the enemy system's arrays
+ENEMY_NORMAL = 0
+ENEMY_SHOOTER = 1
+ENEMY_BOSS = 2
+ENEMY_TYPES = ["normal", "shooter", "boss"]
+COLLECTIBLE_TYPES = ["health", "life", "coin"]
+PROJECTILE_OWNERS = ["player", "enemy"]
+
+# Sprite layers of the render queue, drawn in this order
+LAYER_COLLECTIBLES = 0
+LAYER_ENEMIES = 1
+LAYER_STATUS = 2  # enemy health bars and hurt outlines
+LAYER_PROJECTILES = 3
+LAYER_PLAYER = 4
+
+# Simulation runs in fixed steps, rendering runs as fast as RENDER_FPS allows (0 = uncapped)
+SIM_DT = 1 / 60
+MAX_STEPS_PER_FRAME = 5
+RENDER_FPS = 60
+
+# Every simulation step is kept for rewinding, up to this many steps or bytes
+REWIND_FRAMES = 600
+REWIND_BYTES = 8 * 1024 * 1024
+KEYFRAME_INTERVAL = 60  # steps between whole snapshots, the rest are deltas
+QUICKSAVE_FILE = "quicksave.ahs"
+QUICKSAVE_MAGIC = b"AHS5"
+QUICKSAVE_HEADER = struct.Struct("<4sH")  # magic and the length of the level file names
+
+def lerp(a, b, t):
+    return a + (b - a) * t
 
 # Colors
 BACKGROUND = (135, 206, 235)
@@ -24,18 +94,195 @@ BROWN = (139, 69, 19)
 BLACK = (30, 30, 30)
 WHITE = (240, 240, 240)
 
-# Fonts
-font_large = pygame.font.SysFont("Arial", 48, bold=True)
-font_medium = pygame.font.SysFont("Arial", 36)
-font_small = pygame.font.SysFont("Arial", 24)
-
 # Game states
 MENU = 0
 PLAYING = 1
 GAME_OVER = 2
 LEVEL_COMPLETE = 3
 
-class Player:
+# Input bits for one simulation step
+INPUT_LEFT = 1
+INPUT_RIGHT = 2
+INPUT_JUMP = 4
+INPUT_SHOOT = 8
+INPUT_START = 16  # SPACE on the menu, R on the game over screen
+INPUT_REWIND = 32
+
+def find_fonts():
+    # Paths of the regular and bold game font, from FONT_CACHE when the files are still there
+    try:
+        with open(FONT_CACHE) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    
+    paths = []
+    changed = False
+    for bold in (False, True):
+        key = FONT_NAME + (" bold" if bold else "")
+        path = cache.get(key, "")
+        if path == "" or (path is not None and not os.path.exists(path)):
+            path = pygame.font.match_font(FONT_NAME, bold=bold)
+            cache[key] = path
+            changed = True
+        paths.append(path)
+    
+    if changed:
+        try:
+            os.makedirs(os.path.dirname(FONT_CACHE), exist_ok=True)
+            with open(FONT_CACHE, "w") as f:
+                json.dump(cache, f, indent=1)
+        except OSError:
+            pass  # no cache this time, the fonts still work
+    return paths
+
+def load_font(path, size, bold=False, regular_path=None):
+    # Like SysFont, fake bold when there is no separate bold font file
+    font = pygame.font.Font(path, size)
+    if bold and (path is None or path == regular_path):
+        font.set_bold(True)
+    return font
+
+def init_display():
+    global screen, font_large, font_medium, font_small
+    
+    # Initialize only the parts of Pygame the game uses, sound is optional
+    pygame.display.init()
+    pygame.font.init()
+    try:
+        pygame.mixer.init()
+    except pygame.error:
+        pass
+    
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Animal Hero vs Human Enemies")
+    
+    # Fonts
+    regular, bold = find_fonts()
+    font_large = load_font(bold, 48, True, regular)
+    font_medium = load_font(regular, 36)
+    font_small = load_font(regular, 24)
+
+def read_keyboard():
+    keys = pygame.key.get_pressed()
+    inputs = 0
+    if keys[pygame.K_LEFT] or keys[pygame.K_a]:
+        inputs |= INPUT_LEFT
+    if keys[pygame.K_RIGHT] or keys[pygame.K_d]:
+        inputs |= INPUT_RIGHT
+    if keys[pygame.K_SPACE] or keys[pygame.K_w] or keys[pygame.K_UP]:
+        inputs |= INPUT_JUMP
+    if keys[pygame.K_BACKSPACE]:
+        inputs |= INPUT_REWIND
+    return inputs
+
+def merge_rects(rects):
+    # Joins overlapping rectangles until none overlap, so no area is drawn twice
+    merged = []
+    for rect in rects:
+        rect = pygame.Rect(rect)
+        index = rect.collidelist(merged)
+        while index != -1:
+            rect.union_ip(merged.pop(index))
+            index = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
+
+class TextCache:
+    # Rendered text surfaces keyed by (font, text, color) so unchanged strings
+    # are not re-rendered every frame
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.surfaces = {}
+
+    def render(self, font, text, color):
+        key = (id(font), text, color)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            # Values like the score keep changing, so don't grow forever
+            if len(self.surfaces) >= self.max_size:
+                self.surfaces.clear()
+            surface = font.render(text, True, color)
+            self.surfaces[key] = surface
+        return surface
+
+class HUD:
+    def __init__(self):
+        self.text_cache = TextCache()
+        
+        # HUD strip across the top of the screen, only the regions whose
+        # values changed are redrawn into it
+        self.strip = pygame.Surface((WIDTH, 50), pygame.SRCALPHA)
+        self.regions = {}  # name -> (value, rect)
+        self.dirty = []  # screen areas changed since the last frame
+        
+        # Single preallocated full-screen overlay shared by menu/game over/level complete
+        self.overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
+        self.overlay_key = None
+
+    def text(self, font, text, color):
+        return self.text_cache.render(font, text, color)
+
+    def update_region(self, name, value, draw_region):
+        old = self.regions.get(name)
+        if old is not None and old[0] == value:
+            return
+        # Clear what was there before and draw the new value
+        if old is not None:
+            self.strip.fill((0, 0, 0, 0), old[1])
+            self.dirty.append(old[1])
+        rect = draw_region(self.strip)
+        self.regions[name] = (value, rect)
+        self.dirty.append(rect)
+
+    def blit_areas(self, surface, source, pos, areas=None):
+        # Blit the whole source, or only the parts of it inside the given screen areas
+        if areas is None:
+            surface.blit(source, pos)
+            return
+        bounds = source.get_rect(topleft=pos)
+        for area in areas:
+            clip = bounds.clip(area)
+            if clip.width and clip.height:
+                surface.blit(source, clip.topleft, clip.move(-pos[0], -pos[1]))
+
+    def begin_overlay(self, key, alpha):
+        # Returns True when the overlay needs to be composed again
+        if key == self.overlay_key:
+            return False
+        self.overlay_key = key
+        self.overlay.fill((0, 0, 0, alpha))
+        return True
+
+    def blit_centered(self, surface, y):
+        self.overlay.blit(surface, (WIDTH//2 - surface.get_width()//2, y))
+        
+    def blit_overlay(self, surface):
+        surface.blit(self.overlay, (0, 0))
+
+class Entity:
+    # What every kind of entity shares. Entities with many instances live in an
+    # EntityStore and are views into it, the few others keep their values in __slots__.
+    __slots__ = ()
+    
+    def save_position(self):
+        self.prev_x = self.x
+        self.prev_y = self.y
+    
+    def render_pos(self, alpha):
+        # Position between the last two simulation steps
+        return lerp(self.prev_x, self.x, alpha), lerp(self.prev_y, self.y, alpha)
+    
+    def check_collision(self, obj):
+        return (self.x < obj.x + obj.width and
+                self.x + self.width > obj.x and
+                self.y < obj.y + obj.height and
+                self.y + self.height > obj.y)
+
+class Player(Entity):
+    __slots__ = ("x", "y", "width", "height", "vel_x", "vel_y", "speed", "jump_power", "gravity", "is_jumping",
+                 "direction", "health", "lives", "score", "shoot_cooldown", "hurt_timer", "prev_x", "prev_y")
+    
     def __init__(self, x, y):
         self.x = x
         self.y = y
@@ -53,8 +300,10 @@ class Player:
         self.score = 0
         self.shoot_cooldown = 0
         self.hurt_timer = 0
+        self.prev_x = x  # position at the start of the current simulation step
+        self.prev_y = y
 
-    def move(self, platforms):
+    def move(self, platforms, level_width):
         # Apply gravity
         self.vel_y += self.gravity
         
@@ -84,8 +333,8 @@ class Player:
         # Boundary checks
         if self.x < 0:
             self.x = 0
-        if self.x > 5000 - self.width:
-            self.x = 5000 - self.width
+        if self.x > level_width - self.width:
+            self.x = level_width - self.width
         if self.y > HEIGHT:
             self.health = 0
         
@@ -104,239 +353,1004 @@ class Player:
             self.vel_y = self.jump_power
             self.is_jumping = True
 
-    def shoot(self):
+    def shoot(self, projectiles):
+        # Fires into a ProjectileSystem, returns the new projectile or None
         if self.shoot_cooldown == 0:
             self.shoot_cooldown = 15
-            return Projectile(self.x + self.width//2, self.y + self.height//2, 10 * self.direction, 0, "player")
+            return projectiles.spawn(self.x + self.width//2, self.y + self.height//2, 10 * self.direction, 0, "player")
         return None
 
-    def check_collision(self, obj):
-        return (self.x < obj.x + obj.width and
-                self.x + self.width > obj.x and
-                self.y < obj.y + obj.height and
-                self.y + self.height > obj.y)
-
-    def draw(self, screen, camera_x):
-        # Draw player (animal hero - fox)
-        draw_x = self.x - camera_x
+    def draw(self, screen, camera_x, alpha=1.0, simple=False):
+        # Draw player (animal hero - fox), simple is just the body and head
+        draw_x, draw_y = self.render_pos(alpha)
+        draw_x -= camera_x
         
         # Body
-        pygame.draw.ellipse(screen, (255, 140, 0), (draw_x, self.y, self.width, self.height))
+        pygame.draw.ellipse(screen, (255, 140, 0), (draw_x, draw_y, self.width, self.height))
         
         # Head
         head_size = 30
-        pygame.draw.circle(screen, (255, 140, 0), (draw_x + self.width//2 + (10 * self.direction), self.y - 10), head_size)
+        pygame.draw.circle(screen, (255, 140, 0), (draw_x + self.width//2 + (10 * self.direction), draw_y - 10), head_size)
+        if simple:
+            return
         
         # Ears
         pygame.draw.polygon(screen, (255, 100, 0), [
-            (draw_x + self.width//2 - 10, self.y - 35),
-            (draw_x + self.width//2 - 25, self.y - 50),
-            (draw_x + self.width//2, self.y - 40)
+            (draw_x + self.width//2 - 10, draw_y - 35),
+            (draw_x + self.width//2 - 25, draw_y - 50),
+            (draw_x + self.width//2, draw_y - 40)
         ])
         pygame.draw.polygon(screen, (255, 100, 0), [
-            (draw_x + self.width//2 + 10, self.y - 35),
-            (draw_x + self.width//2 + 25, self.y - 50),
-            (draw_x + self.width//2, self.y - 40)
+            (draw_x + self.width//2 + 10, draw_y - 35),
+            (draw_x + self.width//2 + 25, draw_y - 50),
+            (draw_x + self.width//2, draw_y - 40)
         ])
         
         # Eyes
         eye_offset = 5 * self.direction
-        pygame.draw.circle(screen, BLACK, (draw_x + self.width//2 + eye_offset - 5, self.y - 15), 5)
-        pygame.draw.circle(screen, BLACK, (draw_x + self.width//2 + eye_offset + 5, self.y - 15), 5)
+        pygame.draw.circle(screen, BLACK, (draw_x + self.width//2 + eye_offset - 5, draw_y - 15), 5)
+        pygame.draw.circle(screen, BLACK, (draw_x + self.width//2 + eye_offset + 5, draw_y - 15), 5)
         
         # Tail
-        pygame.draw.ellipse(screen, (255, 100, 0), (draw_x - 15, self.y + 10, 30, 15))
+        pygame.draw.ellipse(screen, (255, 100, 0), (draw_x - 15, draw_y + 10, 30, 15))
 
-class Projectile:
-    def __init__(self, x, y, vel_x, vel_y, owner):
-        self.x = x
-        self.y = y
-        self.vel_x = vel_x
-        self.vel_y = vel_y
-        self.radius = 6
-        self.owner = owner  # "player" or "enemy"
-        self.color = YELLOW if owner == "player" else RED
+    def submit(self, queue, camera_x, alpha=1.0, simple=False):
+        x, y = self.render_pos(alpha)
+        queue.add(LAYER_PLAYER, ("simple_player" if simple else "player", self.direction), x - camera_x, y)
 
-    def move(self):
-        self.x += self.vel_x
-        self.y += self.vel_y
-        self.vel_y += 0.3  # Gravity effect
+    def get_draw_rect(self, camera_x, alpha=1.0):
+        # Everything draw() touches, including head, ears and tail
+        draw_x, draw_y = self.render_pos(alpha)
+        return pygame.Rect(draw_x - camera_x - 21, draw_y - 51, 82, self.height + 52)
 
-    def is_off_screen(self, camera_x):
-        return (self.x < camera_x - 100 or 
-                self.x > camera_x + WIDTH + 100 or
-                self.y > HEIGHT + 100)
+class EntityStore:
+    # Shared core for the kinds of entity there are many of. Each field is one typed,
+    # contiguous numpy array, so a system like gravity or cooldowns runs once over a
+    # whole kind, and the entities themselves are VIEW objects reading their row.
+    FIELDS = {}  # name -> dtype, type_code first
+    PREVIOUS = {"prev_x": "x", "prev_y": "y"}  # kept from the last step for interpolation
+    WIDTH = 0
+    HEIGHT = 0
+    VIEW = None
+    # Up to this many entities a system loops over plain lists instead, numpy's fixed
+    # cost per call outweighs what it saves on the handful a level normally has
+    SCALAR_LIMIT = 16
+    
+    def __init__(self, capacity=64):
+        self.count = 0
+        self.arrays = {name: np.zeros(capacity, dtype) for name, dtype in self.FIELDS.items()}
+        self.views = []  # views[i].index == i
+    
+    @property
+    def capacity(self):
+        return len(self.arrays["type_code"])
+    
+    def grow(self, needed):
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        for name, array in self.arrays.items():
+            self.arrays[name] = np.resize(array, capacity)
+    
+    def add(self, values):
+        # Adds one entity from a field -> value dict, fields left out start at 0
+        if self.count == self.capacity:
+            self.grow(self.count + 1)
+        index = self.count
+        for name, array in self.arrays.items():
+            array[index] = values.get(name, 0)
+        self.count += 1
+        view = self.VIEW(self, index)
+        self.views.append(view)
+        return view
+    
+    def add_many(self, columns):
+        # Adds as many entities as the columns (field -> array) are long
+        k = len(columns["type_code"])
+        start, end = self.count, self.count + k
+        if end > self.capacity:
+            self.grow(end)
+        for name, array in self.arrays.items():
+            array[start:end] = columns.get(name, 0)
+        self.count = end
+        self.views += [self.VIEW(self, index) for index in range(start, end)]
+    
+    def record(self, index):
+        # One entity's values in FIELDS order, for restore() or RECORD
+        return tuple(array[index].item() for array in self.arrays.values())
+    
+    def restore(self, record):
+        return self.add(dict(zip(self.FIELDS, record)))
+    
+    def remove(self, view):
+        # Swap the last entity into the freed slot, returns the record to restore it
+        index = view.index
+        saved = self.record(index)
+        last = self.count - 1
+        if index != last:
+            for array in self.arrays.values():
+                array[index] = array[last]
+            moved = self.views[last]
+            moved.index = index
+            self.views[index] = moved
+        self.views.pop()
+        self.count -= 1
+        view.index = -1
+        return saved
+    
+    def discard(self, mask):
+        # Removes every entity where mask is set, keeping the others in order, and
+        # returns the records of those removed
+        if not mask.any():
+            return []
+        gone = np.flatnonzero(mask)
+        records = [self.record(index) for index in gone]
+        keep = np.flatnonzero(~mask)
+        n = len(keep)
+        for array in self.arrays.values():
+            array[:n] = array[keep]
+        for index in gone:
+            self.views[index].index = -1
+        self.views = [self.views[index] for index in keep]
+        for index, view in enumerate(self.views):
+            view.index = index
+        self.count = n
+        return records
+    
+    def discard_at(self, indices):
+        # discard() for a list of indices
+        if not indices:
+            return []
+        mask = np.zeros(self.count, dtype=bool)
+        mask[indices] = True
+        return self.discard(mask)
+    
+    def clear(self):
+        for view in self.views:
+            view.index = -1
+        self.views = []
+        self.count = 0
+    
+    def copy_from(self, other):
+        # Makes this store a copy of other's live entities, reusing its own buffers
+        n = other.count
+        if self.capacity < n:
+            self.grow(n)
+        for name, array in self.arrays.items():
+            array[:n] = other.arrays[name][:n]
+        self.count = n
+        del self.views[n:]
+        self.views += [self.VIEW(self, index) for index in range(len(self.views), n)]
+    
+    def save_positions(self):
+        n = self.count
+        if n == 0:
+            return
+        for previous, current in self.PREVIOUS.items():
+            self.arrays[previous][:n] = self.arrays[current][:n]
+    
+    def tick(self, mask, *names):
+        # Counts the named timers down toward 0 for the entities in mask
+        for name in names:
+            timer = self.arrays[name][:self.count]
+            timer[mask & (timer > 0)] -= 1
+    
+    def overlapping(self, obj):
+        # Indices of the entities that overlap obj's rectangle
+        if self.count == 0:
+            return []
+        left, top = obj.x, obj.y
+        right, bottom = left + obj.width, top + obj.height
+        if self.count <= self.SCALAR_LIMIT:
+            w, h = self.WIDTH, self.HEIGHT
+            return [i for i, (x, y) in enumerate(zip(self.x.tolist(), self.y.tolist()))
+                    if x < right and x + w > left and y < bottom and y + h > top]
+        x, y = self.x, self.y
+        return np.flatnonzero((x < right) & (x + self.WIDTH > left) & (y < bottom) & (y + self.HEIGHT > top)).tolist()
+    
+    def save_state(self):
+        # The count and the live part of every array, as bytes
+        n = self.count
+        return b"".join([struct.pack("<I", n)] + [array[:n].tobytes() for array in self.arrays.values()])
+    
+    def load_state(self, data, offset=0):
+        # Replaces every entity with those in data from save_state(), returns the offset after them
+        n, = struct.unpack_from("<I", data, offset)
+        offset += 4
+        if self.capacity < n:
+            self.grow(n)
+        for array in self.arrays.values():
+            array[:n] = np.frombuffer(data, array.dtype, n, offset)
+            offset += n * array.itemsize
+        self.clear()
+        self.count = n
+        self.views = [self.VIEW(self, index) for index in range(n)]
+        return offset
 
-    def draw(self, screen, camera_x):
-        pygame.draw.circle(screen, self.color, (self.x - camera_x, self.y), self.radius)
-        pygame.draw.circle(screen, WHITE, (self.x - camera_x, self.y), self.radius - 2)
+def store_record(store):
+    # Struct packing one record() of a store
+    return struct.Struct("<" + "".join(np.dtype(dtype).char for dtype in store.FIELDS.values()))
 
-class Enemy:
-    def __init__(self, x, y, enemy_type):
-        self.x = x
-        self.y = y
-        self.width = 40
-        self.height = 60
-        self.vel_x = 0
-        self.vel_y = 0
-        self.enemy_type = enemy_type  # "normal", "shooter", "boss"
-        self.health = 50 if enemy_type == "normal" else 70 if enemy_type == "shooter" else 300
-        self.max_health = self.health
-        self.speed = random.choice([-1.5, -1, 1, 1.5])
-        self.shoot_cooldown = random.randint(60, 120)
-        self.direction = -1 if random.random() < 0.5 else 1
-        self.move_timer = random.randint(30, 90)
-        self.hurt_timer = 0
+def store_column(name):
+    # store.x etc. are the live part of each array
+    def get(self):
+        return self.arrays[name][:self.count]
+    return property(get)
+
+def store_field(name):
+    def get(self):
+        return self.system.arrays[name][self.index]
+    def set(self, value):
+        self.system.arrays[name][self.index] = value
+    return property(get, set)
+
+def attach_view(store, view):
+    # Makes view the entity class of store, both get a property for each field
+    store.VIEW = view
+    store.RECORD = store_record(store)
+    for name in store.FIELDS:
+        setattr(store, name, store_column(name))
+        setattr(view, name, store_field(name))
+
+class EntityView(Entity):
+    # One entity in an EntityStore, reading and writing its arrays
+    __slots__ = ("system", "index")
+    
+    def __init__(self, system, index):
+        self.system = system
+        self.index = index
 
-    def move(self, platforms, player_x):
-        # Simple AI
-        self.move_timer -= 1
-        if self.move_timer <= 0:
-            self.speed = random.choice([-1.5, -1, 1, 1.5])
-            self.move_timer = random.randint(30, 90)
-            self.direction = -1 if self.speed < 0 else 1
-        
-        # Move toward player if boss
-        if self.enemy_type == "boss":
-            if player_x < self.x:
-                self.speed = -2
-                self.direction = -1
+class ProjectileSystem(EntityStore):
+    FIELDS = {"type_code": np.int8, "x": np.float64, "y": np.float64, "vel_x": np.float64, "vel_y": np.float64,
+              "prev_x": np.float64, "prev_y": np.float64}
+    RADIUS = 6
+    GRAVITY = 0.3
+    
+    def spawn(self, x, y, vel_x, vel_y, owner):
+        return self.add({"type_code": PROJECTILE_OWNERS.index(owner), "x": x, "y": y, "vel_x": vel_x,
+                         "vel_y": vel_y, "prev_x": x, "prev_y": y})
+    
+    def spawn_many(self, x, y, vel_x, vel_y, owner):
+        self.add_many({"type_code": np.full(len(x), PROJECTILE_OWNERS.index(owner)), "x": x, "y": y,
+                       "vel_x": vel_x, "vel_y": vel_y, "prev_x": x, "prev_y": y})
+    
+    def update(self, camera_x):
+        # Moves every projectile and drops those that left the screen
+        if self.count == 0:
+            return
+        if self.count <= self.SCALAR_LIMIT:
+            self.update_few(camera_x)
+            return
+        x, y, vel_y = self.x, self.y, self.vel_y
+        x += self.vel_x
+        y += vel_y
+        vel_y += self.GRAVITY
+        self.discard((x < camera_x - 100) | (x > camera_x + WIDTH + 100) | (y > HEIGHT + 100))
+    
+    def update_few(self, camera_x):
+        # update() one projectile at a time over plain lists
+        n = self.count
+        x, y, vel_x, vel_y = self.x.tolist(), self.y.tolist(), self.vel_x.tolist(), self.vel_y.tolist()
+        gone = []
+        for i in range(n):
+            x[i] += vel_x[i]
+            y[i] += vel_y[i]
+            vel_y[i] += self.GRAVITY
+            if x[i] < camera_x - 100 or x[i] > camera_x + WIDTH + 100 or y[i] > HEIGHT + 100:
+                gone.append(i)
+        self.arrays["x"][:n] = x
+        self.arrays["y"][:n] = y
+        self.arrays["vel_y"][:n] = vel_y
+        self.discard_at(gone)
+    
+    def hits(self, owner, x, y, reach):
+        # Indices of owner's projectiles closer than reach to the point x, y
+        if self.count <= self.SCALAR_LIMIT:
+            code = PROJECTILE_OWNERS.index(owner)
+            hits = []
+            for i, (proj_x, proj_y, proj_code) in enumerate(zip(self.x.tolist(), self.y.tolist(),
+                                                               self.type_code.tolist())):
+                dx = proj_x - x
+                dy = proj_y - y
+                if proj_code == code and math.sqrt(dx*dx + dy*dy) < reach:
+                    hits.append(i)
+            return hits
+        dx = self.x - x
+        dy = self.y - y
+        return np.flatnonzero((self.type_code == PROJECTILE_OWNERS.index(owner)) &
+                              (np.sqrt(dx*dx + dy*dy) < reach)).tolist()
+
+class Projectile(EntityView):
+    __slots__ = ()
+    radius = ProjectileSystem.RADIUS
+    
+    @property
+    def owner(self):
+        return PROJECTILE_OWNERS[self.type_code]
+    
+    @property
+    def color(self):
+        return YELLOW if self.type_code == 0 else RED
+
+    def draw(self, screen, camera_x, alpha=1.0):
+        x, y = self.render_pos(alpha)
+        pygame.draw.circle(screen, self.color, (x - camera_x, y), self.radius)
+        pygame.draw.circle(screen, WHITE, (x - camera_x, y), self.radius - 2)
+
+    def get_draw_rect(self, camera_x, alpha=1.0):
+        x, y = self.render_pos(alpha)
+        size = self.radius * 2 + 2
+        return pygame.Rect(x - camera_x - self.radius - 1, y - self.radius - 1, size, size)
+
+attach_view(ProjectileSystem, Projectile)
+
+class NavGraph:
+    # Platforms as nodes joined by the walk, jump and drop moves enemy physics can make,
+    # built whenever the loaded platforms change. The flow field gives every platform the
+    # first move on its shortest path to a target platform, and is only recomputed when
+    # the target (the platform the player last stood on) changes.
+    WALK = 0
+    JUMP = 1
+    DROP = 2
+    LEAP_SPEED = 4  # jumps and drops are made at a run, the chase speed can't clear gaps
+    AIR_TIME = 60  # longest a move may stay in the air, in simulation steps
+    JUMP_POWER = -15
+    GRAVITY = 0.8
+    
+    def __init__(self, platforms, width, height):
+        self.platforms = platforms
+        self.width = width
+        self.height = height
+        
+        # Highest a jump gets, to skip pairs no move can join
+        vel, rise, self.max_rise = self.JUMP_POWER, 0, 0
+        while vel < 0:
+            vel += self.GRAVITY
+            rise -= vel
+            self.max_rise = max(self.max_rise, rise)
+        
+        n = len(platforms)
+        self.index = {}  # (x, y) -> first platform there, to find a target again after a rebuild
+        for i, platform in enumerate(platforms):
+            self.index.setdefault((platform.x, platform.y), i)
+        self.incoming = [[] for _ in range(n)]  # to -> [(from, action, takeoff x, direction, cost)]
+        for a, start in enumerate(platforms):
+            for b, end in enumerate(platforms):
+                if a != b:
+                    move = self.connect(start, end)
+                    if move is not None:
+                        self.incoming[b].append((a,) + move)
+        
+        # Flow field, per platform: the move to make (-1 for none), where and which way
+        self.target = None
+        self.action = np.full(n, -1, dtype=np.int8)
+        self.takeoff = np.zeros(n)
+        self.direction = np.zeros(n)
+    
+    def connect(self, start, end):
+        # The cheapest move from standing on start to standing on end, as
+        # (action, takeoff x, direction, cost), or None
+        w = self.width
+        gap = max(end.x - (start.x + start.width), start.x - (end.x + end.width))
+        if gap > self.LEAP_SPEED * self.AIR_TIME or start.y - end.y > self.max_rise:
+            return None
+        if start.y == end.y:
+            if gap > 0:
+                return None
+            direction = 1 if end.x > start.x else -1
+            takeoff = start.x + start.width - w if direction == 1 else start.x
+            return self.WALK, takeoff, direction, abs(gap) + 10
+        
+        best = None
+        for direction in (1, -1):
+            if end.y > start.y:
+                # Walk off the edge and fall
+                takeoffs = [start.x + start.width - w if direction == 1 else start.x]
+                action = self.DROP
             else:
-                self.speed = 2
-                self.direction = 1
+                # Jump so the body is above end's top by the time it gets over end,
+                # or failing that jump from the very edge
+                vel, rise, steps = self.JUMP_POWER, 0, 0
+                while rise < start.y - end.y and vel < 0:
+                    vel += self.GRAVITY
+                    rise -= vel
+                    steps += 1
+                if direction == 1:
+                    ideal = end.x - w + 1 - self.LEAP_SPEED * steps
+                else:
+                    ideal = end.x + end.width - 1 + self.LEAP_SPEED * steps
+                low, high = start.x - w + 1, start.x + start.width - 1
+                edge = start.x + start.width - w if direction == 1 else start.x
+                takeoffs = [min(max(ideal, low), high), edge]
+                action = self.JUMP
+            for takeoff in takeoffs:
+                landing = self.simulate(takeoff, start, end, direction, action)
+                if landing is not None:
+                    cost = abs(landing - takeoff) + abs(start.y - end.y) / 2 + 30
+                    if best is None or cost < best[3]:
+                        best = (action, takeoff, direction, cost)
+                    break
+        return best
+    
+    def simulate(self, x, start, end, direction, action):
+        # Follows the enemy physics from start until it lands on end, returns the x it
+        # lands at, or None if it bumps into end or misses it
+        w, h = self.width, self.height
+        vel = self.JUMP_POWER if action == self.JUMP else 0
+        feet = start.y
+        if action == self.DROP:
+            # Walking to the point the body no longer touches start
+            x = start.x + start.width if direction == 1 else start.x - w
+        for _ in range(self.AIR_TIME):
+            vel += self.GRAVITY
+            feet += vel
+            x += self.LEAP_SPEED * direction
+            over = x < end.x + end.width and x + w > end.x
+            if over and feet - h < end.y + end.height and feet > end.y:
+                # Landing needs to be falling with the body's top still above end's top,
+                # and the body past end's near side or the side collision bounces it off
+                past = x >= end.x if direction == 1 else x + w <= end.x + end.width
+                return x if vel > 0 and feet - h < end.y and past else None
+            if vel > 0 and feet - h > end.y + end.height:
+                return None
+        return None
+    
+    def aim(self, position):
+        # Points the flow field at the platform at position, an (x, y) pair, or at nothing
+        # when position is None or that platform isn't loaded
+        target = self.index.get(position)
+        if target == self.target:
+            return
+        if target is None:
+            self.target = None
+            self.action[:] = -1
+        else:
+            self.set_target(target)
+    
+    def set_target(self, target):
+        # Recomputes the flow field toward the target platform with Dijkstra over the
+        # moves reversed, so every platform learns its first move
+        self.target = target
+        self.action[:] = -1
+        cost = {target: 0}
+        queue = [(0, target)]
+        while queue:
+            total, node = heapq.heappop(queue)
+            if total > cost[node]:
+                continue
+            for start, action, takeoff, direction, move_cost in self.incoming[node]:
+                new_cost = total + move_cost
+                if new_cost < cost.get(start, math.inf):
+                    cost[start] = new_cost
+                    self.action[start] = action
+                    self.takeoff[start] = takeoff
+                    self.direction[start] = direction
+                    heapq.heappush(queue, (new_cost, start))
+
+class EnemySystem(EntityStore):
+    # All enemy state lives in numpy arrays so the AI runs as a few array operations
+    # per frame instead of a method call per enemy. Enemy objects are views into it.
+    FIELDS = {"type_code": np.int8, "x": np.float64, "y": np.float64, "vel_x": np.float64, "vel_y": np.float64,
+              "prev_x": np.float64, "prev_y": np.float64, "speed": np.float64, "direction": np.int8,
+              "health": np.int32, "max_health": np.int32, "shoot_cooldown": np.int32, "move_timer": np.int32,
+              "hurt_timer": np.int32, "hunting": np.int8}
+    WIDTH = 40
+    HEIGHT = 60
+    SPEEDS = np.array([-1.5, -1, 1, 1.5])
+    HEALTH = np.array([50, 70, 300])
+    SHOOT_COOLDOWN = np.array([0, 90, 45])
+    CHASE_SPEED = np.array([1.5, 0, 2])  # by type, shooters don't chase
+    # PCG64 state and increment halves, has_uint32, uinteger, then whether there is a chase
+    # target and its x and y
+    STATE = struct.Struct("<4QBI?dd")
+    
+    def __init__(self, seed, capacity=64):
+        super().__init__(capacity)
+        self.rng = np.random.default_rng(seed)
+        self.awake_count = 0
+        self.platform_cache = None
+        self.nav = None
+        # Position of the platform the player last stood on, kept here rather than in the
+        # navigation graph so it survives rebuilds and is part of the saved state
+        self.chase_target = None
+    
+    def spawn(self, x, y, enemy_type):
+        code = ENEMY_TYPES.index(enemy_type)
+        speed = self.SPEEDS[self.rng.integers(4)]
+        return self.add({
+            "type_code": code,
+            "x": x, "y": y, "vel_x": 0, "vel_y": 0, "prev_x": x, "prev_y": y,
+            "speed": speed,
+            "direction": -1 if self.rng.random() < 0.5 else 1,
+            "health": self.HEALTH[code], "max_health": self.HEALTH[code],
+            "shoot_cooldown": self.rng.integers(60, 121),
+            "move_timer": self.rng.integers(30, 91),
+            "hurt_timer": 0,
+            "hunting": 0,
+        })
+    
+    def clear(self):
+        super().clear()
+        self.chase_target = None
+    
+    def save_state(self):
+        # The random generator and chase target followed by every enemy, as bytes
+        rng = self.rng.bit_generator.state
+        target_x, target_y = self.chase_target or (0, 0)
+        header = self.STATE.pack(rng["state"]["state"] >> 64, rng["state"]["state"] & (2**64 - 1),
+                                 rng["state"]["inc"] >> 64, rng["state"]["inc"] & (2**64 - 1),
+                                 rng["has_uint32"], rng["uinteger"],
+                                 self.chase_target is not None, target_x, target_y)
+        return header + super().save_state()
+    
+    def load_state(self, data, offset=0):
+        (state_high, state_low, inc_high, inc_low, has_uint32, uinteger,
+         has_target, target_x, target_y) = self.STATE.unpack_from(data, offset)
+        self.rng.bit_generator.state = {
+            "bit_generator": "PCG64",
+            "state": {"state": state_high << 64 | state_low, "inc": inc_high << 64 | inc_low},
+            "has_uint32": has_uint32, "uinteger": uinteger,
+        }
+        offset = super().load_state(data, offset + self.STATE.size)
+        self.chase_target = (target_x, target_y) if has_target else None
+        return offset
+    
+    def hit_by(self, x, y, radius):
+        # The first enemy a projectile of radius at x, y hits, or None
+        if self.count == 0:
+            return None
+        reach = radius + max(self.WIDTH, self.HEIGHT)//2
+        if self.count <= self.SCALAR_LIMIT:
+            for index, (enemy_x, enemy_y) in enumerate(zip(self.x.tolist(), self.y.tolist())):
+                dx = x - (enemy_x + self.WIDTH//2)
+                dy = y - (enemy_y + self.HEIGHT//2)
+                if math.sqrt(dx*dx + dy*dy) < reach:
+                    return self.views[index]
+            return None
+        dx = x - (self.x + self.WIDTH//2)
+        dy = y - (self.y + self.HEIGHT//2)
+        hits = np.flatnonzero(np.sqrt(dx*dx + dy*dy) < reach)
+        return self.views[hits[0]] if len(hits) else None
+    
+    def reached_by(self, projectiles):
+        # Indices of the player's projectiles that could hit an enemy, a quick superset of
+        # hit_by(). Points are tested against every enemy in blocks, so the temporaries
+        # stay small.
+        if self.count == 0:
+            return []
+        reach = projectiles.RADIUS + max(self.WIDTH, self.HEIGHT)//2
+        if self.count <= self.SCALAR_LIMIT and projectiles.count <= self.SCALAR_LIMIT:
+            centers = [(x + self.WIDTH//2, y + self.HEIGHT//2) for x, y in zip(self.x.tolist(), self.y.tolist())]
+            near = []
+            for i, (code, x, y) in enumerate(zip(projectiles.type_code.tolist(), projectiles.x.tolist(),
+                                                 projectiles.y.tolist())):
+                if code == 0:
+                    for center_x, center_y in centers:
+                        dx, dy = x - center_x, y - center_y
+                        if dx*dx + dy*dy <= reach * reach:
+                            near.append(i)
+                            break
+            return near
+        mine = np.flatnonzero(projectiles.type_code == 0)
+        x, y = projectiles.x[mine], projectiles.y[mine]
+        reached = np.zeros(len(x), dtype=bool)
+        center_x = self.x + self.WIDTH//2
+        center_y = self.y + self.HEIGHT//2
+        for start in range(0, len(x), 256):
+            dx = x[start:start + 256, None] - center_x
+            dy = y[start:start + 256, None] - center_y
+            reached[start:start + 256] = (dx*dx + dy*dy <= reach * reach).any(axis=1)
+        return mine[reached].tolist()
+    
+    def platform_arrays(self, platforms):
+        # Platform rectangles as arrays, rebuilt only when the platform list changes
+        if self.platform_cache is None or self.platform_cache[0] is not platforms:
+            rects = np.array([(p.x, p.y, p.width, p.height) for p in platforms], dtype=float).reshape(-1, 4)
+            edges = [(p.x, p.y, p.x + p.width, p.y + p.height) for p in platforms]
+            self.platform_cache = (platforms, rects.T, edges)
+        return self.platform_cache[1]
+    
+    def platform_edges(self, platforms):
+        # Left, top, right and bottom of every platform, for the loops over plain values
+        if self.platform_cache is None or self.platform_cache[0] is not platforms:
+            self.platform_arrays(platforms)
+        return self.platform_cache[2]
+    
+    def standing_on(self, platforms, x, y, height):
+        # Index of the platform each body stands on, -1 if none
+        px, py, pw, ph = self.platform_arrays(platforms)
+        stand = ((np.abs(py - (y + height)[:, None]) < 0.5) &
+                 (x[:, None] < px + pw) & (x[:, None] + self.WIDTH > px))
+        return np.where(stand.any(axis=1), stand.argmax(axis=1), -1)
+    
+    def platform_under(self, platforms, x, feet):
+        # standing_on() for a single body, without the arrays
+        for k, (left, top, right, _) in enumerate(self.platform_edges(platforms)):
+            if abs(top - feet) < 0.5 and x < right and x + self.WIDTH > left:
+                return k
+        return -1
+    
+    def navigate(self, platforms, player):
+        # The navigation graph of platforms, aimed at the platform the player last stood
+        # on. The flow field only changes when the player lands on another platform.
+        if self.nav is None or self.nav.platforms is not platforms:
+            self.nav = NavGraph(platforms, self.WIDTH, self.HEIGHT)
+        target = self.platform_under(platforms, player.x, player.y + player.height)
+        if target >= 0:
+            self.chase_target = (platforms[target].x, platforms[target].y)
+        self.nav.aim(self.chase_target)
+        return self.nav
+    
+    def chase(self, chasing, platforms, player):
+        # Steers grounded hunters along the navigation graph toward the player's platform
+        nav = self.navigate(platforms, player)
+        index = np.flatnonzero(chasing & (self.vel_y == 0))
+        if nav.target is None or len(index) == 0:
+            return
+        x = self.x[index]
+        on = self.standing_on(platforms, x, self.y[index], self.HEIGHT)
+        index, x, on = index[on >= 0], x[on >= 0], on[on >= 0]
+        chase_speed = self.CHASE_SPEED[self.type_code[index]]
         
-        # Apply movement
-        self.vel_x = self.speed
-        self.vel_y += 0.8  # Gravity
+        # On the player's platform, or with no way there, head straight for the player.
+        # Otherwise go to the takeoff point of the next move, then make it.
+        action = nav.action[on]
+        direct = (on == nav.target) | (action < 0)
+        to_takeoff = nav.takeoff[on] - x
+        # Drops are made from anywhere past the takeoff point, it's where the body still
+        # just touches the platform
+        at_takeoff = ((np.abs(to_takeoff) <= chase_speed) |
+                      ((action == NavGraph.DROP) & (to_takeoff * nav.direction[on] <= 0)))
+        toward_player = np.where(player.x < x, -1, 1)
+        direction = np.where(direct, toward_player, np.where(at_takeoff, nav.direction[on], np.sign(to_takeoff)))
+        move = ~direct & at_takeoff
+        self.speed[index] = direction * np.where(move, NavGraph.LEAP_SPEED, chase_speed)
+        self.direction[index] = direction
+        jump = move & (action == NavGraph.JUMP)
+        self.vel_y[index[jump]] = NavGraph.JUMP_POWER
+    
+    def update(self, platforms, player, level_width, projectiles):
+        # Moves every awake enemy, fires their shots into a ProjectileSystem and returns
+        # how many were fired
+        n = self.count
+        if n == 0:
+            self.awake_count = 0
+            return 0
+        if n <= self.SCALAR_LIMIT:
+            return self.update_few(platforms, player, level_width, projectiles)
+        player_x, player_y = player.x, player.y
+        x, y = self.x, self.y
+        vel_x, vel_y = self.vel_x, self.vel_y
+        speed, direction = self.speed, self.direction
+        types = self.type_code[:n]
+        w, h = self.WIDTH, self.HEIGHT
         
-        # Update position
-        self.x += self.vel_x
-        self.y += self.vel_y
+        # Enemies far from the player sleep until the player comes near
+        awake = np.abs(x - player_x) <= ACTIVE_RADIUS
+        self.awake_count = int(awake.sum())
         
-        # Platform collisions
-        for platform in platforms:
-            if self.check_collision(platform):
-                # Bottom collision
-                if self.vel_y > 0 and self.y + self.height > platform.y and self.y < platform.y:
-                    self.y = platform.y - self.height
-                    self.vel_y = 0
-                # Top collision
-                elif self.vel_y < 0 and self.y < platform.y + platform.height and self.y + self.height > platform.y + platform.height:
-                    self.y = platform.y + platform.height
-                    self.vel_y = 0
-                # Horizontal collisions
-                if self.vel_x > 0 and self.x + self.width > platform.x and self.x < platform.x:
-                    self.x = platform.x - self.width
-                    self.speed *= -1
-                elif self.vel_x < 0 and self.x < platform.x + platform.width and self.x + self.width > platform.x + platform.width:
-                    self.x = platform.x + platform.width
-                    self.speed *= -1
+        # Bosses hunt the player, and so do normal enemies once the player has come near.
+        # They keep at it until they fall asleep, as the way up to the player can lead
+        # further away first.
+        hunting = self.hunting
+        hunting[awake & (types == ENEMY_NORMAL) & (np.abs(x - player_x) < CHASE_RADIUS)] = 1
+        hunting[~awake] = 0
+        chasing = awake & ((types == ENEMY_BOSS) | (hunting == 1))
         
-        # Boundary checks
-        if self.x < 0:
-            self.x = 0
-            self.speed *= -1
-        if self.x > 5000 - self.width:
-            self.x = 5000 - self.width
-            self.speed *= -1
+        # Simple AI for the rest, a new random walk whenever the move timer runs out
+        self.move_timer[awake] -= 1
+        expired = awake & ~chasing & (self.move_timer <= 0)
+        count = int(expired.sum())
+        if count:
+            speed[expired] = self.SPEEDS[self.rng.integers(0, 4, count)]
+            self.move_timer[expired] = self.rng.integers(30, 91, count)
+            direction[expired] = np.where(speed[expired] < 0, -1, 1)
         
-        # Update cooldown
-        if self.shoot_cooldown > 0:
-            self.shoot_cooldown -= 1
-        if self.hurt_timer > 0:
-            self.hurt_timer -= 1
-
-    def shoot(self, player_x, player_y):
-        if self.enemy_type in ["shooter", "boss"] and self.shoot_cooldown == 0:
-            self.shoot_cooldown = 90 if self.enemy_type == "shooter" else 45
+        if chasing.any():
+            self.chase(chasing, platforms, player)
+        
+        # Apply movement and gravity
+        vel_x[awake] = speed[awake]
+        vel_y[awake] += 0.8
+        x[awake] += vel_x[awake]
+        y[awake] += vel_y[awake]
+        
+        # Platform collisions. One enemies x platforms overlap test finds the platforms
+        # anyone touches, then those are resolved one at a time over all enemies at
+        # once, in the same order the per-enemy code used.
+        px, py, pw, ph = self.platform_arrays(platforms)
+        touching = ((x[:, None] < px + pw) & (x[:, None] + w > px) &
+                    (y[:, None] < py + ph) & (y[:, None] + h > py) & awake[:, None]).any(axis=0)
+        for k in np.flatnonzero(touching):
+            platform = platforms[k]
+            hit = (awake & (x < platform.x + platform.width) & (x + w > platform.x) &
+                   (y < platform.y + platform.height) & (y + h > platform.y))
             
-            # Calculate direction to player
-            dx = player_x - self.x
-            dy = player_y - self.y
-            dist = max(1, math.sqrt(dx*dx + dy*dy))
+            # Bottom collision
+            bottom = hit & (vel_y > 0) & (y + h > platform.y) & (y < platform.y)
+            y[bottom] = platform.y - h
+            vel_y[bottom] = 0
+            # Top collision
+            top = hit & ~bottom & (vel_y < 0) & (y < platform.y + platform.height) & (y + h > platform.y + platform.height)
+            y[top] = platform.y + platform.height
+            vel_y[top] = 0
+            # Horizontal collisions
+            right = hit & (vel_x > 0) & (x + w > platform.x) & (x < platform.x)
+            x[right] = platform.x - w
+            speed[right] *= -1
+            left = hit & ~right & (vel_x < 0) & (x < platform.x + platform.width) & (x + w > platform.x + platform.width)
+            x[left] = platform.x + platform.width
+            speed[left] *= -1
+        
+        # Boundary checks
+        low = awake & (x < 0)
+        x[low] = 0
+        speed[low] *= -1
+        high = awake & (x > level_width - w)
+        x[high] = level_width - w
+        speed[high] *= -1
+        
+        # Update cooldowns
+        self.tick(awake, "shoot_cooldown", "hurt_timer")
+        
+        # Shooters and bosses fire at the player at random once their cooldown is over
+        rolls = self.rng.random(n)
+        fire = awake & (rolls < 0.02) & (types != ENEMY_NORMAL) & (self.shoot_cooldown == 0)
+        shooters = np.flatnonzero(fire)
+        if len(shooters) == 0:
+            return 0
+        self.shoot_cooldown[shooters] = self.SHOOT_COOLDOWN[types[shooters]]
+        
+        # Aim at the player
+        dx = player_x - x[shooters]
+        dy = player_y - y[shooters]
+        dist = np.maximum(1, np.sqrt(dx*dx + dy*dy))
+        projectiles.spawn_many(x[shooters] + w//2, y[shooters] + h//2, 8 * dx / dist, 8 * dy / dist, "enemy")
+        return len(shooters)
+    
+    def update_few(self, platforms, player, level_width, projectiles):
+        # update() one enemy at a time over plain lists. Every operation and random draw
+        # is made in the same order as there, so both give exactly the same results.
+        n = self.count
+        arrays = self.arrays
+        player_x, player_y = player.x, player.y
+        x = arrays["x"][:n].tolist()
+        awake = [abs(enemy_x - player_x) <= ACTIVE_RADIUS for enemy_x in x]
+        self.awake_count = sum(awake)
+        if not self.awake_count:
+            # Nobody moves or shoots, but the random draw is still made
+            arrays["hunting"][:n] = 0
+            self.rng.random(n)
+            return 0
+        
+        types = arrays["type_code"][:n].tolist()
+        y = arrays["y"][:n].tolist()
+        vel_x, vel_y = arrays["vel_x"][:n].tolist(), arrays["vel_y"][:n].tolist()
+        speed, direction = arrays["speed"][:n].tolist(), arrays["direction"][:n].tolist()
+        move_timer, hunting = arrays["move_timer"][:n].tolist(), arrays["hunting"][:n].tolist()
+        shoot_cooldown, hurt_timer = arrays["shoot_cooldown"][:n].tolist(), arrays["hurt_timer"][:n].tolist()
+        w, h = self.WIDTH, self.HEIGHT
+        
+        # Only the columns that change are written back at the end
+        changed = {"x", "y", "vel_x", "vel_y", "speed", "move_timer"}
+        
+        # Who hunts and whose random walk runs out
+        chasing = []
+        expired = []
+        for i in range(n):
+            if not awake[i]:
+                if hunting[i]:
+                    hunting[i] = 0
+                    changed.add("hunting")
+                continue
+            if types[i] == ENEMY_NORMAL and abs(x[i] - player_x) < CHASE_RADIUS and not hunting[i]:
+                hunting[i] = 1
+                changed.add("hunting")
+            move_timer[i] -= 1
+            if types[i] == ENEMY_BOSS or hunting[i] == 1:
+                chasing.append(i)
+            elif move_timer[i] <= 0:
+                expired.append(i)
+        if expired:
+            changed.add("direction")
+            speeds = self.SPEEDS[self.rng.integers(0, 4, len(expired))].tolist()
+            timers = self.rng.integers(30, 91, len(expired)).tolist()
+            for i, new_speed, timer in zip(expired, speeds, timers):
+                speed[i] = new_speed
+                move_timer[i] = timer
+                direction[i] = -1 if new_speed < 0 else 1
+        
+        if chasing:
+            nav = self.navigate(platforms, player)
+            if nav.target is not None:
+                changed.add("direction")
+                chase_speeds = self.CHASE_SPEED.tolist()
+                for i in chasing:
+                    if vel_y[i] != 0:
+                        continue
+                    on = self.platform_under(platforms, x[i], y[i] + h)
+                    if on < 0:
+                        continue
+                    chase_speed = chase_speeds[types[i]]
+                    action = nav.action[on].item()
+                    to_takeoff = nav.takeoff[on].item() - x[i]
+                    if on == nav.target or action < 0:
+                        way, move = (-1 if player_x < x[i] else 1), False
+                    elif (abs(to_takeoff) <= chase_speed or
+                          (action == NavGraph.DROP and to_takeoff * nav.direction[on].item() <= 0)):
+                        way, move = nav.direction[on].item(), True
+                    else:
+                        way, move = (to_takeoff > 0) - (to_takeoff < 0), False
+                    speed[i] = way * (NavGraph.LEAP_SPEED if move else chase_speed)
+                    direction[i] = int(way)
+                    if move and action == NavGraph.JUMP:
+                        vel_y[i] = NavGraph.JUMP_POWER
+        
+        # Movement, then the platforms anyone touches in platform order, as in update()
+        edges = self.platform_edges(platforms)
+        touched = set()
+        for i in range(n):
+            if not awake[i]:
+                continue
+            vel_x[i] = speed[i]
+            vel_y[i] += 0.8
+            x[i] += vel_x[i]
+            y[i] += vel_y[i]
+            left_of, right_of, top_of, bottom_of = x[i], x[i] + w, y[i], y[i] + h
+            for k, (left, top, right, bottom) in enumerate(edges):
+                if left_of < right and right_of > left and top_of < bottom and bottom_of > top:
+                    touched.add(k)
+        touched = [edges[k] for k in sorted(touched)]
+        
+        fire = []
+        rolls = self.rng.random(n).tolist()
+        for i in range(n):
+            if not awake[i]:
+                continue
+            for left, top, right, bottom in touched:
+                if not (x[i] < right and x[i] + w > left and y[i] < bottom and y[i] + h > top):
+                    continue
+                if vel_y[i] > 0 and y[i] + h > top and y[i] < top:
+                    y[i] = top - h
+                    vel_y[i] = 0
+                elif vel_y[i] < 0 and y[i] < bottom and y[i] + h > bottom:
+                    y[i] = bottom
+                    vel_y[i] = 0
+                if vel_x[i] > 0 and x[i] + w > left and x[i] < left:
+                    x[i] = left - w
+                    speed[i] *= -1
+                elif vel_x[i] < 0 and x[i] < right and x[i] + w > right:
+                    x[i] = right
+                    speed[i] *= -1
             
-            # Normalize and set velocity
-            vel_x = 8 * dx / dist
-            vel_y = 8 * dy / dist
+            if x[i] < 0:
+                x[i] = 0
+                speed[i] *= -1
+            if x[i] > level_width - w:
+                x[i] = level_width - w
+                speed[i] *= -1
             
-            return Projectile(self.x + self.width//2, self.y + self.height//2, vel_x, vel_y, "enemy")
-        return None
+            if shoot_cooldown[i] > 0:
+                shoot_cooldown[i] -= 1
+                changed.add("shoot_cooldown")
+            if hurt_timer[i] > 0:
+                hurt_timer[i] -= 1
+                changed.add("hurt_timer")
+            if rolls[i] < 0.02 and types[i] != ENEMY_NORMAL and shoot_cooldown[i] == 0:
+                shoot_cooldown[i] = self.SHOOT_COOLDOWN[types[i]].item()
+                changed.add("shoot_cooldown")
+                fire.append(i)
+        
+        for name, values in (("x", x), ("y", y), ("vel_x", vel_x), ("vel_y", vel_y), ("speed", speed),
+                             ("direction", direction), ("move_timer", move_timer), ("hunting", hunting),
+                             ("shoot_cooldown", shoot_cooldown), ("hurt_timer", hurt_timer)):
+            if name in changed:
+                arrays[name][:n] = values
+        
+        # Aim at the player
+        for i in fire:
+            dx = player_x - x[i]
+            dy = player_y - y[i]
+            dist = max(1, math.sqrt(dx*dx + dy*dy))
+            projectiles.spawn(x[i] + w//2, y[i] + h//2, 8 * dx / dist, 8 * dy / dist, "enemy")
+        return len(fire)
 
-    def check_collision(self, obj):
-        return (self.x < obj.x + obj.width and
-                self.x + self.width > obj.x and
-                self.y < obj.y + obj.height and
-                self.y + self.height > obj.y)
+class Enemy(EntityView):
+    __slots__ = ()
+    width = EnemySystem.WIDTH
+    height = EnemySystem.HEIGHT
+    
+    @property
+    def enemy_type(self):
+        return ENEMY_TYPES[self.type_code]
 
-    def draw(self, screen, camera_x):
-        draw_x = self.x - camera_x
+    def draw(self, screen, camera_x, alpha=1.0):
+        draw_x, draw_y = self.render_pos(alpha)
+        draw_x -= camera_x
         
         # Draw based on enemy type
-        if self.enemy_type == "normal":
+        if self.type_code == ENEMY_NORMAL:
             # Human soldier
             # Body
-            pygame.draw.rect(screen, BLUE, (draw_x, self.y + 20, self.width, self.height - 20))
+            pygame.draw.rect(screen, BLUE, (draw_x, draw_y + 20, self.width, self.height - 20))
             # Head
-            pygame.draw.circle(screen, (255, 220, 180), (draw_x + self.width//2, self.y + 10), 15)
+            pygame.draw.circle(screen, (255, 220, 180), (draw_x + self.width//2, draw_y + 10), 15)
             # Helmet
-            pygame.draw.rect(screen, (100, 100, 120), (draw_x + 5, self.y, self.width - 10, 15))
+            pygame.draw.rect(screen, (100, 100, 120), (draw_x + 5, draw_y, self.width - 10, 15))
             
-        elif self.enemy_type == "shooter":
+        elif self.type_code == ENEMY_SHOOTER:
             # Human shooter
             # Body
-            pygame.draw.rect(screen, RED, (draw_x, self.y + 20, self.width, self.height - 20))
+            pygame.draw.rect(screen, RED, (draw_x, draw_y + 20, self.width, self.height - 20))
             # Head
-            pygame.draw.circle(screen, (255, 220, 180), (draw_x + self.width//2, self.y + 10), 15)
+            pygame.draw.circle(screen, (255, 220, 180), (draw_x + self.width//2, draw_y + 10), 15)
             # Helmet with visor
-            pygame.draw.rect(screen, (60, 60, 80), (draw_x + 5, self.y, self.width - 10, 15))
-            pygame.draw.rect(screen, (100, 200, 255, 100), (draw_x + 10, self.y + 3, self.width - 20, 8))
+            pygame.draw.rect(screen, (60, 60, 80), (draw_x + 5, draw_y, self.width - 10, 15))
+            pygame.draw.rect(screen, (100, 200, 255, 100), (draw_x + 10, draw_y + 3, self.width - 20, 8))
             
         else:  # boss
             # Big armored enemy
             # Body
-            pygame.draw.rect(screen, PURPLE, (draw_x - 10, self.y + 20, self.width + 20, self.height - 20))
+            pygame.draw.rect(screen, PURPLE, (draw_x - 10, draw_y + 20, self.width + 20, self.height - 20))
             # Head
-            pygame.draw.circle(screen, (255, 220, 180), (draw_x + self.width//2, self.y + 5), 20)
+            pygame.draw.circle(screen, (255, 220, 180), (draw_x + self.width//2, draw_y + 5), 20)
             # Armor
-            pygame.draw.rect(screen, (80, 80, 100), (draw_x - 15, self.y + 40, self.width + 30, 30))
-            pygame.draw.rect(screen, (80, 80, 100), (draw_x - 5, self.y, self.width + 10, 25))
-            
-            # Health bar
-            bar_width = 80
-            pygame.draw.rect(screen, (100, 100, 100), (draw_x + self.width//2 - bar_width//2, self.y - 30, bar_width, 12))
-            pygame.draw.rect(screen, RED, (draw_x + self.width//2 - bar_width//2, self.y - 30, bar_width * self.health / self.max_health, 12))
-        
-        # Health bar for normal enemies
-        if self.enemy_type != "boss":
-            bar_width = 40
-            pygame.draw.rect(screen, (100, 100, 100), (draw_x + self.width//2 - bar_width//2, self.y - 20, bar_width, 8))
-            pygame.draw.rect(screen, RED, (draw_x + self.width//2 - bar_width//2, self.y - 20, bar_width * self.health / self.max_health, 8))
-        
-        # Draw hurt effect
-        if self.hurt_timer > 0:
-            pygame.draw.rect(screen, (255, 150, 150), (draw_x, self.y, self.width, self.height), 3)
+            pygame.draw.rect(screen, (80, 80, 100), (draw_x - 15, draw_y + 40, self.width + 30, 30))
+            pygame.draw.rect(screen, (80, 80, 100), (draw_x - 5, draw_y, self.width + 10, 25))
 
-class Collectible:
-    def __init__(self, x, y, collectible_type):
-        self.x = x
-        self.y = y
-        self.width = 30
-        self.height = 30
-        self.collectible_type = collectible_type  # "health", "life", "coin"
-        self.bounce = 0
-        self.bounce_dir = 1
+    def get_draw_rect(self, camera_x, alpha=1.0):
+        draw_x, draw_y = self.render_pos(alpha)
+        draw_x -= camera_x
+        if self.type_code == ENEMY_BOSS:
+            # Armor sticks out 15px on both sides, health bar sits 30px above
+            return pygame.Rect(draw_x - 16, draw_y - 31, self.width + 32, self.height + 42)
+        return pygame.Rect(draw_x - 1, draw_y - 21, self.width + 2, self.height + 22)
+
+attach_view(EnemySystem, Enemy)
 
+class CollectibleSystem(EntityStore):
+    FIELDS = {"type_code": np.int8, "x": np.float64, "y": np.float64, "bounce": np.float64,
+              "prev_bounce": np.float64, "bounce_dir": np.int8}
+    PREVIOUS = {"prev_bounce": "bounce"}
+    WIDTH = 30
+    HEIGHT = 30
+    
+    def spawn(self, x, y, collectible_type):
+        return self.add({"type_code": COLLECTIBLE_TYPES.index(collectible_type), "x": x, "y": y, "bounce_dir": 1})
+    
     def update(self):
         # Bouncing animation
-        self.bounce += 0.1 * self.bounce_dir
-        if self.bounce > 0.5:
-            self.bounce_dir = -1
-        elif self.bounce < -0.5:
-            self.bounce_dir = 1
+        n = self.count
+        if n == 0:
+            return
+        if n <= self.SCALAR_LIMIT:
+            bounce, bounce_dir = self.bounce.tolist(), self.bounce_dir.tolist()
+            for i in range(n):
+                bounce[i] += 0.1 * bounce_dir[i]
+                if bounce[i] > 0.5:
+                    bounce_dir[i] = -1
+                elif bounce[i] < -0.5:
+                    bounce_dir[i] = 1
+            self.arrays["bounce"][:n] = bounce
+            self.arrays["bounce_dir"][:n] = bounce_dir
+            return
+        bounce, bounce_dir = self.bounce, self.bounce_dir
+        bounce += 0.1 * bounce_dir
+        bounce_dir[bounce > 0.5] = -1
+        bounce_dir[bounce < -0.5] = 1
 
-    def draw(self, screen, camera_x):
+class Collectible(EntityView):
+    __slots__ = ()
+    width = CollectibleSystem.WIDTH
+    height = CollectibleSystem.HEIGHT
+    
+    @property
+    def collectible_type(self):  # "health", "life", "coin"
+        return COLLECTIBLE_TYPES[self.type_code]
+
+    def draw(self, screen, camera_x, alpha=1.0):
         draw_x = self.x - camera_x
-        draw_y = self.y + self.bounce * 5
+        draw_y = self.y + lerp(self.prev_bounce, self.bounce, alpha) * 5
         
         if self.collectible_type == "health":
             # Health pack
@@ -362,7 +1376,15 @@ class Collectible:
             pygame.draw.circle(screen, (240, 220, 100), (draw_x + self.width//2, draw_y + self.height//2), self.width//4)
             pygame.draw.rect(screen, YELLOW, (draw_x + self.width//2 - 2, draw_y + 5, 4, self.height - 10))
 
-class Platform:
+    def get_draw_rect(self, camera_x, alpha=1.0):
+        draw_y = self.y + lerp(self.prev_bounce, self.bounce, alpha) * 5
+        return pygame.Rect(self.x - camera_x - 1, draw_y - 1, self.width + 2, self.height + 2)
+
+attach_view(CollectibleSystem, Collectible)
+
+class Platform(Entity):
+    __slots__ = ("x", "y", "width", "height", "color")
+    
     def __init__(self, x, y, width, height, color=BROWN):
         self.x = x
         self.y = y
@@ -375,158 +1397,931 @@ class Platform:
         # Platform top
         pygame.draw.rect(screen, (160, 110, 60), (self.x - camera_x, self.y, self.width, 5))
 
-class Game:
+def generate_chunk(seed, index, chunk_width):
+    # Procedural chunk, the same seed and index always give the same chunk
+    rng = random.Random(seed * 1000003 + index)
+    chunk = {"platforms": [], "enemies": [], "collectibles": []}
+    for _ in range(rng.randint(1, 3)):
+        x = rng.randrange(50, chunk_width - 250, 10)
+        y = rng.choice([300, 350, 400, 450])
+        width = rng.choice([150, 200])
+        chunk["platforms"].append([x, y, width, 20])
+        
+        # Something to fight or pick up on most platforms, but nothing near the start
+        if index > 0 and rng.random() < 0.7:
+            enemy_type = "shooter" if rng.random() < 0.3 else "normal"
+            chunk["enemies"].append([x + rng.randrange(0, width - 40), y - 60, enemy_type])
+        if rng.random() < 0.5:
+            collectible_type = rng.choice(["coin", "coin", "coin", "health", "life"])
+            chunk["collectibles"].append([x + width//2 - 15, y - 40, collectible_type])
+    return chunk
+
+class LevelData:
+    def __init__(self, data):
+        self.name = data.get("name", "")
+        self.goal = data.get("goal", "clear")  # "clear", "boss" or "reach_end"
+        self.chunk_width = data.get("chunk_width", 1000)
+        self.ground = data.get("ground")  # [y, height] of the ground across the whole level
+        
+        # Either a list of chunks or a generator that makes them on demand
+        self.chunks = data.get("chunks")
+        self.generator = data.get("generate")
+        if self.chunks is not None:
+            self.chunk_count = len(self.chunks)
+            self.enemy_count = sum(len(chunk.get("enemies", [])) for chunk in self.chunks)
+        else:
+            self.chunk_count = self.generator["chunks"]
+            self.enemy_count = None  # unknown without generating every chunk
+        self.width = self.chunk_count * self.chunk_width
+    
+    def chunk(self, index):
+        # Platforms, enemies and collectibles of one chunk with x relative to the chunk
+        if self.chunks is not None:
+            return self.chunks[index]
+        return generate_chunk(self.generator["seed"], index, self.chunk_width)
+
+level_cache = {}
+
+def load_level(path):
+    if not os.path.exists(path):
+        path = os.path.join(LEVEL_DIR, path)
+    level_data = level_cache.get(path)
+    if level_data is None:
+        with open(path) as f:
+            level_data = LevelData(json.load(f))
+        level_cache[path] = level_data
+    return level_data
+
+class ChunkStreamer:
+    # Keeps the chunks around the camera loaded into the game's entity lists. Chunks
+    # that were visited and unloaded keep only their surviving enemies and collectibles.
+    def __init__(self, level_data):
+        self.level_data = level_data
+        self.loaded = {}  # chunk index -> platforms of that chunk
+        self.visited = set()  # chunks whose enemies and collectibles were created
+        self.stored = {}  # chunk index -> (enemy records, collectible records) while unloaded
+        
+        # The ground is one platform across the whole level and always loaded
+        self.ground = []
+        if level_data.ground:
+            y, height = level_data.ground
+            self.ground.append(Platform(0, y, level_data.width, height))
+    
+    def chunk_index(self, x):
+        index = int(x // self.level_data.chunk_width)
+        return max(0, min(self.level_data.chunk_count - 1, index))
+    
+    def update(self, game):
+        # Returns the x range whose platforms changed, or None if nothing was streamed
+        left = min(game.camera_x, game.player.x - WIDTH) - STREAM_MARGIN
+        right = max(game.camera_x, game.player.x) + WIDTH + STREAM_MARGIN
+        needed = set(range(self.chunk_index(left), self.chunk_index(right) + 1))
+        if needed == self.loaded.keys():
+            return None
+        
+        changed = []
+        for index in sorted(self.loaded.keys() - needed):
+            changed += self.unload(index, game)
+        for index in sorted(needed - self.loaded.keys()):
+            changed += self.load(index, game)
+        game.platforms = self.platforms()
+        return (min(changed), max(changed)) if changed else None
+    
+    def platforms(self):
+        return self.ground + [p for index in sorted(self.loaded) for p in self.loaded[index]]
+    
+    def chunk_platforms(self, index):
+        data = self.level_data.chunk(index)
+        chunk_x = index * self.level_data.chunk_width
+        return [Platform(chunk_x + x, y, width, height) for x, y, width, height in data.get("platforms", [])]
+    
+    def load(self, index, game):
+        data = self.level_data.chunk(index)
+        chunk_x = index * self.level_data.chunk_width
+        platforms = self.chunk_platforms(index)
+        self.loaded[index] = platforms
+        
+        # Enemies and collectibles are only created from the level data the first time
+        if index not in self.visited:
+            self.visited.add(index)
+            for x, y, enemy_type in data.get("enemies", []):
+                game.enemy_system.spawn(chunk_x + x, y, enemy_type)
+            for x, y, collectible_type in data.get("collectibles", []):
+                game.collectible_system.spawn(chunk_x + x, y, collectible_type)
+        
+        enemies, collectibles = self.stored.pop(index, ([], []))
+        for record in enemies:
+            game.enemy_system.restore(record)
+        for record in collectibles:
+            game.collectible_system.restore(record)
+        return [x for p in platforms for x in (p.x, p.x + p.width)]
+    
+    def unload(self, index, game):
+        platforms = self.loaded.pop(index)
+        
+        # Anything standing in a chunk that is no longer loaded goes to sleep in storage
+        def is_unloaded(entity):
+            return self.chunk_index(entity.x) not in self.loaded
+        
+        for enemy in [e for e in game.enemies if is_unloaded(e)]:
+            chunk = self.chunk_index(enemy.x)
+            self.store(chunk, game.enemy_system.remove(enemy), 0)
+        collectibles = game.collectible_system
+        unloaded = np.array([self.chunk_index(x) not in self.loaded for x in collectibles.x.tolist()], dtype=bool)
+        for record in collectibles.discard(unloaded):
+            self.store(self.chunk_index(record[1]), record, 1)  # record[1] is x
+        return [x for p in platforms for x in (p.x, p.x + p.width)]
+    
+    def store(self, index, record, kind):
+        if index not in self.stored:
+            self.stored[index] = ([], [])
+        self.stored[index][kind].append(record)
+    
+    # Chunk index with how many stored enemies and collectibles follow
+    STORED = struct.Struct("<iII")
+    
+    def save_state(self):
+        loaded = sorted(self.loaded)
+        visited = sorted(self.visited)
+        parts = [struct.pack(f"<III{len(loaded)}i{len(visited)}i", len(loaded), len(visited), len(self.stored),
+                             *loaded, *visited)]
+        for index, (enemies, collectibles) in self.stored.items():
+            parts.append(self.STORED.pack(index, len(enemies), len(collectibles)))
+            parts += [EnemySystem.RECORD.pack(*record) for record in enemies]
+            parts += [CollectibleSystem.RECORD.pack(*record) for record in collectibles]
+        return b"".join(parts)
+    
+    def load_state(self, game, data, offset):
+        # Restores what save_state() saved, reloading platforms only if other chunks were loaded
+        loaded_count, visited_count, stored_count = struct.unpack_from("<III", data, offset)
+        offset += 12
+        loaded = list(struct.unpack_from(f"<{loaded_count}i", data, offset))
+        offset += loaded_count * 4
+        self.visited = set(struct.unpack_from(f"<{visited_count}i", data, offset))
+        offset += visited_count * 4
+        
+        self.stored = {}
+        for _ in range(stored_count):
+            index, enemy_count, collectible_count = self.STORED.unpack_from(data, offset)
+            offset += self.STORED.size
+            records = []
+            for record, count in ((EnemySystem.RECORD, enemy_count), (CollectibleSystem.RECORD, collectible_count)):
+                records.append([record.unpack_from(data, offset + i * record.size) for i in range(count)])
+                offset += count * record.size
+            self.stored[index] = tuple(records)
+        
+        if loaded != sorted(self.loaded):
+            self.loaded = {index: self.chunk_platforms(index) for index in loaded}
+            game.platforms = self.platforms()
+            if game.background:
+                game.platform_changes.append(None)
+        return offset
+
+class Background:
+    # Parallax background pre-rendered into cached layers that are blitted with an offset
+    TILE_WIDTH = 1000
+    MAX_TILES = 6
+    MOUNTAIN_SCROLL = 0.2
+    
+    MOUNTAINS_WIDTH = 1500
+    
+    def __init__(self):
+        # Sky and distant mountains. The mountains only cover the first 1500px of the
+        # layer, past that it is plain sky, so the layer doesn't grow with the level.
+        self.mountains = pygame.Surface((self.MOUNTAINS_WIDTH + WIDTH, HEIGHT)).convert()
+        self.mountains.fill(BACKGROUND)
+        for i in range(5):
+            height = 150 + i*20
+            pygame.draw.polygon(self.mountains, (100, 120, 140), [
+                (i*300, HEIGHT),
+                (i*300, HEIGHT - height),
+                ((i+1)*300, HEIGHT - height - 50),
+                ((i+1)*300, HEIGHT)
+            ])
+        
+        # Platforms are static, so they are rendered once into world-space tiles
+        self.platforms = []
+        self.tiles = {}
+    
+    def set_platforms(self, platforms, x_range=None):
+        # Only the tiles within x_range need redrawing when a chunk was streamed in or out
+        self.platforms = platforms
+        if x_range is None:
+            self.tiles = {}
+            return
+        first = int(x_range[0]) // self.TILE_WIDTH
+        last = int(x_range[1]) // self.TILE_WIDTH
+        for index in range(first, last + 1):
+            self.tiles.pop(index, None)
+    
+    def get_tile(self, index):
+        tile = self.tiles.get(index)
+        if tile is None:
+            # Drop the tiles furthest from the one we need
+            if len(self.tiles) >= self.MAX_TILES:
+                far = max(self.tiles, key=lambda i: abs(i - index))
+                del self.tiles[far]
+            
+            tile = pygame.Surface((self.TILE_WIDTH, HEIGHT)).convert()
+            tile.fill((255, 0, 255))
+            tile.set_colorkey((255, 0, 255))
+            tile_x = index * self.TILE_WIDTH
+            for platform in self.platforms:
+                if platform.x < tile_x + self.TILE_WIDTH and platform.x + platform.width > tile_x:
+                    platform.draw(tile, tile_x)
+            self.tiles[index] = tile
+        return tile
+    
+    def draw(self, surface, camera_x, area=None, mountains=True):
+        # Restrict to one area when only part of the screen needs restoring
+        if area is not None:
+            surface.set_clip(area)
+        
+        # Sky and mountains, or plain sky when the mountains are left out
+        if mountains:
+            offset = min(int(camera_x * self.MOUNTAIN_SCROLL), self.MOUNTAINS_WIDTH)
+            surface.blit(self.mountains, (0, 0), (offset, 0, WIDTH, HEIGHT))
+        else:
+            surface.fill(BACKGROUND)
+        
+        # Platforms
+        first = int(camera_x) // self.TILE_WIDTH
+        last = int(camera_x + WIDTH) // self.TILE_WIDTH
+        for index in range(first, last + 1):
+            surface.blit(self.get_tile(index), (index * self.TILE_WIDTH - camera_x, 0))
+        
+        if area is not None:
+            surface.set_clip(None)
+
+class SpriteAtlas:
+    # Every sprite frame rendered once, with the entities' own draw code, into a single
+    # colorkeyed surface. frames maps a name to (area in the atlas, x offset, y offset),
+    # the offsets placing the frame relative to the entity's position.
+    def __init__(self):
+        sprites = {}  # name -> (bounds relative to the entity's position, paint(surface, x, y))
+        
+        def player(direction, simple=False):
+            def paint(surface, x, y):
+                sprite = Player(x, y)
+                sprite.direction = direction
+                sprite.draw(surface, 0, simple=simple)
+            return paint
+        for direction in (1, -1):
+            sprites[("player", direction)] = ((-21, -51, 82, 112), player(direction))
+            sprites[("simple_player", direction)] = ((-21, -51, 82, 112), player(direction, True))
+        
+        def enemy(code):
+            def paint(surface, x, y):
+                EnemySystem(0, capacity=1).spawn(x, y, ENEMY_TYPES[code]).draw(surface, 0)
+            return paint
+        def rect(color, bounds, width=0):
+            def paint(surface, x, y):
+                pygame.draw.rect(surface, color, (x + bounds[0], y + bounds[1], bounds[2], bounds[3]), width)
+            return paint
+        for code in (ENEMY_NORMAL, ENEMY_SHOOTER, ENEMY_BOSS):
+            if code == ENEMY_BOSS:
+                # Armor sticks out 15px on both sides, the health bar is wider and higher
+                body, bar = (-16, -16, 72, 87), (-20, -30, 80, 12)
+            else:
+                body, bar = (-1, -6, 42, 67), (0, -20, 40, 8)
+            sprites[("enemy", code)] = (body, enemy(code))
+            sprites[("health_back", code)] = (bar, rect((100, 100, 100), bar))
+            sprites[("health", code)] = (bar, rect(RED, bar))
+        hurt = (0, 0, EnemySystem.WIDTH, EnemySystem.HEIGHT)
+        sprites["hurt"] = (hurt, rect((255, 150, 150), hurt, 3))
+        
+        def projectile(owner):
+            def paint(surface, x, y):
+                ProjectileSystem(capacity=1).spawn(x, y, 0, 0, owner).draw(surface, 0)
+            return paint
+        for owner in ("player", "enemy"):
+            sprites[("projectile", owner)] = ((-7, -7, 14, 14), projectile(owner))
+        
+        def collectible(collectible_type):
+            def paint(surface, x, y):
+                CollectibleSystem(capacity=1).spawn(x, y, collectible_type).draw(surface, 0)
+            return paint
+        for collectible_type in COLLECTIBLE_TYPES:
+            sprites[("collectible", collectible_type)] = ((-1, -1, 32, 32), collectible(collectible_type))
+        
+        # Frames side by side in one row, each painted clipped to its own area
+        width = sum(bounds[2] for bounds, _ in sprites.values())
+        height = max(bounds[3] for bounds, _ in sprites.values())
+        self.surface = pygame.Surface((width, height)).convert()
+        self.surface.fill((255, 0, 255))
+        self.surface.set_colorkey((255, 0, 255))
+        self.frames = {}
+        x = 0
+        for name, ((offset_x, offset_y, w, h), paint) in sprites.items():
+            self.surface.set_clip((x, 0, w, h))
+            paint(self.surface, x - offset_x, -offset_y)
+            self.frames[name] = ((x, 0, w, h), offset_x, offset_y)
+            x += w
+        self.surface.set_clip(None)
+
+class RenderQueue:
+    # Sprites submitted during a frame, sorted into layers and drawn from the atlas
+    # with one Surface.blits call per layer instead of a draw call per entity
+    def __init__(self, atlas):
+        self.atlas = atlas
+        self.layers = [[] for _ in range(LAYER_PLAYER + 1)]
+    
+    def add(self, layer, name, x, y, crop=1.0):
+        # crop keeps only that fraction of the frame from the left, for bars
+        area, offset_x, offset_y = self.atlas.frames[name]
+        if crop < 1.0:
+            area = (area[0], area[1], int(area[2] * crop), area[3])
+        self.layers[layer].append((self.atlas.surface, (x + offset_x, y + offset_y), area))
+    
+    def add_collectibles(self, system, camera_x, alpha=1.0):
+        # The add_*() methods read an entity store's arrays directly, with positions
+        # worked out for the whole kind at once
+        frames = [self.atlas.frames[("collectible", name)] for name in COLLECTIBLE_TYPES]
+        xs = system.x - camera_x
+        ys = system.y + lerp(system.prev_bounce, system.bounce, alpha) * 5
+        self.add_all(LAYER_COLLECTIBLES, frames, system.type_code, xs, ys)
+    
+    def add_projectiles(self, system, camera_x, alpha=1.0):
+        frames = [self.atlas.frames[("projectile", owner)] for owner in PROJECTILE_OWNERS]
+        xs = lerp(system.prev_x, system.x, alpha) - camera_x
+        ys = lerp(system.prev_y, system.y, alpha)
+        self.add_all(LAYER_PROJECTILES, frames, system.type_code, xs, ys)
+    
+    def add_all(self, layer, frames, codes, xs, ys):
+        # One sprite per entity, the frame picked by its type code
+        atlas = self.atlas.surface
+        self.layers[layer] += [(atlas, (x + frames[code][1], y + frames[code][2]), frames[code][0])
+                               for x, y, code in zip(xs.tolist(), ys.tolist(), codes.tolist())]
+    
+    def add_enemies(self, system, camera_x, alpha=1.0, status=True):
+        # Enemies with their health bars, status=False leaves out the health bars and
+        # hurt outlines
+        xs = lerp(system.prev_x, system.x, alpha) - camera_x
+        ys = lerp(system.prev_y, system.y, alpha)
+        health = system.health / system.max_health
+        hurt = system.hurt_timer > 0
+        
+        atlas = self.atlas.surface
+        frames = self.atlas.frames
+        bodies = self.layers[LAYER_ENEMIES]
+        status = self.layers[LAYER_STATUS]
+        hurt_area, hurt_x, hurt_y = frames["hurt"]
+        for x, y, code, fraction, is_hurt in zip(xs.tolist(), ys.tolist(), system.type_code.tolist(),
+                                                 health.tolist(), hurt.tolist()):
+            area, offset_x, offset_y = frames[("enemy", code)]
+            bodies.append((atlas, (x + offset_x, y + offset_y), area))
+            if not status:
+                continue
+            
+            # Health bar, with the red part cropped to the health left
+            area, offset_x, offset_y = frames[("health_back", code)]
+            status.append((atlas, (x + offset_x, y + offset_y), area))
+            self.add(LAYER_STATUS, ("health", code), x, y, fraction)
+            
+            # Hurt effect
+            if is_hurt:
+                status.append((atlas, (x + hurt_x, y + hurt_y), hurt_area))
+    
+    def flush(self, surface):
+        for layer in self.layers:
+            if layer:
+                surface.blits(layer, doreturn=False)
+                layer.clear()
+
+class FrameProfiler:
+    # Per-phase frame timings, shown with F3 and exported with F4 or --profile-out
+    PHASES = ["events", "input", "update", "player", "streaming", "projectiles", "enemies", "collectibles",
+              "collisions", "snapshot", "draw", "background", "entities", "hud", "display"]
+    GRAPH_FRAMES = 240
+    
+    def __init__(self, history=3600):
+        self.visible = False
+        self.samples = deque(maxlen=history)
+        self.current = dict.fromkeys(self.PHASES, 0.0)
+        self.frame_start = time.perf_counter()
+        self.frame_count = 0
+        self.panel = None
+        self.panel_lines = []
+    
+    def add(self, phase, start):
+        # Adds the time since start to a phase and returns the current time
+        now = time.perf_counter()
+        self.current[phase] += now - start
+        return now
+    
+    def end_frame(self, steps, counts, budget):
+        now = time.perf_counter()
+        frame_ms = (now - self.frame_start) * 1000
+        self.frame_start = now
+        self.frame_count += 1
+        
+        sample = {"frame": self.frame_count, "frame_ms": frame_ms, "steps": steps,
+                  "dropped": frame_ms > budget * 1000 * 1.5}
+        for phase in self.PHASES:
+            sample[phase + "_ms"] = self.current[phase] * 1000
+            self.current[phase] = 0.0
+        sample.update(counts)
+        self.samples.append(sample)
+    
+    def export(self, path):
+        samples = list(self.samples)
+        if path.endswith(".json"):
+            with open(path, "w") as f:
+                json.dump(samples, f, indent=1)
+        else:
+            with open(path, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=list(samples[0]) if samples else ["frame"])
+                writer.writeheader()
+                writer.writerows(samples)
+        return len(samples)
+    
+    def draw(self, surface, extra_lines=()):
+        if not self.samples:
+            return
+        
+        # Text is averaged over the last 15 frames and only re-rendered 4 times a second
+        if self.frame_count % 15 == 0 or not self.panel_lines:
+            recent = list(self.samples)[-15:]
+            def avg(key):
+                return sum(sample[key] for sample in recent) / len(recent)
+            last = recent[-1]
+            self.panel_lines = [
+                f"frame {avg('frame_ms'):5.2f} ms  ({1000 / max(avg('frame_ms'), 0.001):4.0f} fps)  steps {last['steps']}",
+                f"events {avg('events_ms'):.2f}  input {avg('input_ms'):.2f}  display {avg('display_ms'):.2f}",
+                f"update {avg('update_ms'):.2f}: player {avg('player_ms'):.2f} streaming {avg('streaming_ms'):.2f} "
+                f"projectiles {avg('projectiles_ms'):.2f} enemies {avg('enemies_ms'):.2f}",
+                f"  collectibles {avg('collectibles_ms'):.2f} collisions {avg('collisions_ms'):.2f} "
+                f"snapshot {avg('snapshot_ms'):.2f}",
+                f"draw {avg('draw_ms'):.2f}: background {avg('background_ms'):.2f} entities {avg('entities_ms'):.2f} "
+                f"hud {avg('hud_ms'):.2f}",
+                f"enemies {last['enemies']} ({last['awake']} awake)  projectiles {last['projectiles']}  "
+                f"collectibles {last['collectibles']}  platforms {last['platforms']}",
+            ] + list(extra_lines)
+            self.panel = None
+        
+        if self.panel is None:
+            font = pygame.font.Font(None, 20)
+            self.panel = pygame.Surface((560, 18 * len(self.panel_lines) + 90), pygame.SRCALPHA)
+            self.panel.fill((0, 0, 0, 170))
+            for i, line in enumerate(self.panel_lines):
+                self.panel.blit(font.render(line, True, WHITE), (8, 6 + i * 18))
+        
+        x, y = 10, 60
+        surface.blit(self.panel, (x, y))
+        
+        # Frame time graph, one bar per frame, dropped frames in red, 60 fps budget in yellow
+        graph_bottom = y + self.panel.get_height() - 8
+        scale = 2  # pixels per ms
+        budget_y = graph_bottom - int(1000 / 60 * scale)
+        for i, sample in enumerate(list(self.samples)[-self.GRAPH_FRAMES:]):
+            bar = min(72, int(sample["frame_ms"] * scale))
+            color = RED if sample["dropped"] else GREEN
+            pygame.draw.line(surface, color, (x + 8 + i * 2, graph_bottom), (x + 8 + i * 2, graph_bottom - bar))
+        pygame.draw.line(surface, YELLOW, (x + 8, budget_y), (x + 8 + self.GRAPH_FRAMES * 2, budget_y))
+
+class QualityGovernor:
+    # Steps rendering detail down while frames take longer than the budget, and back up
+    # once there is headroom again. Levels are cumulative, each drops one more thing.
+    LEVELS = ["full", "no enemy bars", "simple player", "no mountains"]
+    WINDOW = 30  # frames averaged for each decision
+    LOWER_AT = 0.9  # share of the budget a window may average before detail drops
+    RAISE_AT = 0.6  # share of the budget windows have to stay under to raise detail
+    RAISE_WINDOWS = 3  # calm windows in a row needed, so detail doesn't flicker
+    
+    def __init__(self):
+        self.level = 0
+        self.times = []
+        self.average = 0.0
+        self.calm = 0
+    
+    @property
+    def name(self):
+        return self.LEVELS[self.level]
+    
+    def update(self, work_time, budget):
+        # work_time is how long the frame took before waiting on the frame cap.
+        # Returns True when the level changed.
+        self.times.append(work_time)
+        if len(self.times) < self.WINDOW:
+            return False
+        self.average = sum(self.times) / len(self.times)
+        self.times = []
+        
+        if self.average > budget * self.LOWER_AT:
+            self.calm = 0
+            if self.level < len(self.LEVELS) - 1:
+                self.level += 1
+                return True
+        elif self.average < budget * self.RAISE_AT:
+            self.calm += 1
+            if self.calm >= self.RAISE_WINDOWS and self.level > 0:
+                self.calm = 0
+                self.level -= 1
+                return True
+        else:
+            self.calm = 0
+        return False
+    
+    def describe(self, budget):
+        return (f"detail level {self.level} ({self.name})  "
+                f"frame work {self.average * 1000:.2f} of {budget * 1000:.2f} ms")
+
+class SoundBank:
+    # Sound effects decoded once on a background thread at startup and played through
+    # a fixed pool of mixer channels. When every channel is busy, a new sound takes over
+    # the oldest of the lowest priority sounds playing, unless those outrank it.
+    CHANNELS = 8
+    
+    # name -> (priority, volume, seconds, start Hz, end Hz, wave) of the synthesized
+    # effect, a .wav or .ogg file of the same name in SOUND_DIR is used instead if present
+    EFFECTS = {
+        "shoot": (0, 0.25, 0.08, 880, 440, "square"),
+        "hit": (1, 0.4, 0.12, 0, 0, "noise"),
+        "pickup": (2, 0.4, 0.15, 660, 1320, "sine"),
+        "boss": (3, 0.6, 0.6, 160, 60, "square"),
+    }
+    
     def __init__(self):
+        self.sounds = {}  # filled in by the loader thread
+        self.enabled = pygame.mixer.get_init() is not None
+        if not self.enabled:
+            return
+        pygame.mixer.set_num_channels(self.CHANNELS)
+        self.channels = [pygame.mixer.Channel(i) for i in range(self.CHANNELS)]
+        self.playing = [(0, 0)] * self.CHANNELS  # (priority, play count) of each channel's sound
+        self.play_count = 0
+        self.loader = threading.Thread(target=self.load, name="sound loader", daemon=True)
+        self.loader.start()
+    
+    def load(self):
+        for name in self.EFFECTS:
+            sound = self.decode(name)
+            if sound is not None:
+                sound.set_volume(self.EFFECTS[name][1])
+                self.sounds[name] = sound
+    
+    def decode(self, name):
+        for extension in (".wav", ".ogg"):
+            path = os.path.join(SOUND_DIR, name + extension)
+            if os.path.exists(path):
+                return pygame.mixer.Sound(path)
+        
+        # Synthesized as 16-bit samples, the mixer's default format
+        frequency, size, channels = pygame.mixer.get_init()
+        if size != -16:
+            return None
+        _, _, seconds, start_hz, end_hz, wave = self.EFFECTS[name]
+        count = int(frequency * seconds)
+        if wave == "noise":
+            samples = np.random.default_rng(0).uniform(-1, 1, count)
+        else:
+            phase = 2 * np.pi * np.cumsum(np.linspace(start_hz, end_hz, count)) / frequency
+            samples = np.sin(phase)
+            if wave == "square":
+                samples = np.sign(samples)
+        samples *= np.linspace(1, 0, count) ** 2  # fade out
+        samples = (samples * 32767).astype(np.int16)
+        if channels > 1:
+            samples = np.repeat(samples[:, None], channels, axis=1)
+        return pygame.sndarray.make_sound(samples)
+    
+    def play_all(self, names):
+        # Plays the sounds the simulation asked for since the last frame
+        if not self.enabled:
+            return
+        for name in names:
+            self.play(name)
+    
+    def play(self, name):
+        sound = self.sounds.get(name)
+        if sound is None:
+            return  # unknown or still loading
+        priority = self.EFFECTS[name][0]
+        
+        # A free channel, or else the one playing the least important, oldest sound
+        free = [i for i, channel in enumerate(self.channels) if not channel.get_busy()]
+        if free:
+            index = free[0]
+        else:
+            index = min(range(self.CHANNELS), key=lambda i: self.playing[i])
+            if self.playing[index][0] > priority:
+                return
+        self.play_count += 1
+        self.playing[index] = (priority, self.play_count)
+        self.channels[index].play(sound)
+
+class RewindBuffer:
+    # Recent game states from Game.save_state(), one per simulation step, in bounded memory.
+    # Every KEYFRAME_INTERVAL steps, and whenever the state's size changes, the whole state
+    # is stored compressed. The steps in between store their XOR with that keyframe, which
+    # is mostly zeros and compresses to very little. Any step restores with two decompressions.
+    def __init__(self, frames=REWIND_FRAMES, max_bytes=REWIND_BYTES):
+        self.frames = frames
+        self.max_bytes = max_bytes
+        self.entries = deque()  # (keyframe entry, or None for a keyframe, compressed bytes)
+        self.bytes = 0
+        self.key = None  # newest keyframe entry and its uncompressed state
+        self.since_key = 0
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def push(self, data):
+        if self.key is None or self.since_key >= KEYFRAME_INTERVAL or len(data) != len(self.key[1]):
+            entry = (None, zlib.compress(data, 1))
+            self.key = (entry, data)
+            self.since_key = 0
+        else:
+            delta = np.frombuffer(data, np.uint8) ^ np.frombuffer(self.key[1], np.uint8)
+            entry = (self.key[0], zlib.compress(delta.tobytes(), 1))
+        self.since_key += 1
+        self.entries.append(entry)
+        self.bytes += len(entry[1])
+        
+        # Drop the oldest steps. Deltas still hold on to their keyframe, at most one extra.
+        while len(self.entries) > self.frames or self.bytes > self.max_bytes:
+            self.bytes -= len(self.entries.popleft()[1])
+    
+    def decode(self, entry):
+        key, compressed = entry
+        data = zlib.decompress(compressed)
+        if key is None:
+            return data
+        return (np.frombuffer(data, np.uint8) ^ np.frombuffer(zlib.decompress(key[1]), np.uint8)).tobytes()
+    
+    def pop(self):
+        # Drops the newest state and returns the one before it, None when there is none left
+        if len(self.entries) < 2:
+            return None
+        self.bytes -= len(self.entries.pop()[1])
+        self.key = None  # the next state pushed starts a new keyframe
+        return self.decode(self.entries[-1])
+    
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+        self.key = None
+
+class Game:
+    # Fixed part of the binary state from save_state(): state, level, game over and level
+    # complete timers, deaths, enemies left (-1 for unknown), awake enemies, boss defeated,
+    # camera and previous camera x
+    STATE = struct.Struct("<BBiiiii?dd")
+    # Player position, velocity and previous position, health, lives, score, shoot
+    # cooldown, hurt timer, direction and jumping
+    PLAYER_STATE = struct.Struct("<6d5qb?")
+    
+    def __init__(self, headless=False, seed=None, level_files=None, rewind=None):
         self.state = MENU
+        
+        # All randomness is seeded from this so a seed and the inputs reproduce a run
+        self.seed = seed if seed is not None else random.randrange(2**32)
+        
+        # Headless games only simulate, so they skip everything used for drawing
+        self.headless = headless
+        self.hud = None if headless else HUD()
+        self.background = None if headless else Background()
+        self.render_queue = None if headless else RenderQueue(SpriteAtlas())
+        self.quality = 0  # QualityGovernor level the game is drawn at
+        self.dirty_rects = []  # entity areas drawn last frame
+        self.last_draw = None
+        self.platform_changes = []  # x ranges of streamed platforms, None for all, until drawn
+        self.sound_events = []  # names of sounds to play, until the main loop plays them
+        self.level_files = list(level_files or LEVEL_FILES)
+        self.profiler = FrameProfiler()
+        self.enemy_system = EnemySystem(self.seed)
+        self.projectile_system = ProjectileSystem()
+        self.collectible_system = CollectibleSystem()
+        self.awake_enemies = 0
+        
+        # Past states to rewind through, kept by default when playing with a window
+        self.history = RewindBuffer() if (not headless if rewind is None else rewind) else None
+        self.rewinding = False
+        self.camera_x = 0
+        self.prev_camera_x = 0
         self.level = 1  # Initialize level FIRST
         self.reset()    # Then call reset
-        self.camera_x = 0
+        self.deaths = 0
         self.game_over_timer = 0
         self.level_complete_timer = 0
         
     def reset(self):
         self.player = Player(200, 300)
-        self.projectiles = []
-        self.enemies = []
-        self.collectibles = []
+        self.projectile_system.clear()
+        self.enemy_system.clear()
+        self.collectible_system.clear()
         self.platforms = []
         self.create_level()
         
     def create_level(self):
         # Clear existing objects
         self.platforms = []
-        self.enemies = []
-        self.collectibles = []
-        
-        # Ground platform
-        self.platforms.append(Platform(0, HEIGHT - 40, 5000, 40))
-        
-        # Level-specific platforms
-        if self.level == 1:
-            # Level 1 - Forest
-            self.platforms.append(Platform(300, HEIGHT - 150, 200, 20))
-            self.platforms.append(Platform(600, HEIGHT - 200, 200, 20))
-            self.platforms.append(Platform(900, HEIGHT - 250, 200, 20))
-            
-            # Enemies
-            self.enemies.append(Enemy(400, HEIGHT - 210, "normal"))
-            self.enemies.append(Enemy(700, HEIGHT - 260, "normal"))
-            self.enemies.append(Enemy(1000, HEIGHT - 310, "shooter"))
-            
-            # Collectibles
-            self.collectibles.append(Collectible(350, HEIGHT - 190, "coin"))
-            self.collectibles.append(Collectible(650, HEIGHT - 240, "health"))
-            self.collectibles.append(Collectible(950, HEIGHT - 290, "coin"))
-            
-        elif self.level == 2:
-            # Level 2 - Mountains
-            self.platforms.append(Platform(300, HEIGHT - 180, 150, 20))
-            self.platforms.append(Platform(500, HEIGHT - 250, 150, 20))
-            self.platforms.append(Platform(700, HEIGHT - 320, 150, 20))
-            self.platforms.append(Platform(900, HEIGHT - 250, 150, 20))
-            self.platforms.append(Platform(1100, HEIGHT - 180, 150, 20))
-            
-            # Enemies
-            self.enemies.append(Enemy(350, HEIGHT - 240, "shooter"))
-            self.enemies.append(Enemy(550, HEIGHT - 310, "normal"))
-            self.enemies.append(Enemy(750, HEIGHT - 380, "shooter"))
-            self.enemies.append(Enemy(950, HEIGHT - 310, "normal"))
-            
-            # Collectibles
-            self.collectibles.append(Collectible(330, HEIGHT - 220, "health"))
-            self.collectibles.append(Collectible(550, HEIGHT - 290, "coin"))
-            self.collectibles.append(Collectible(750, HEIGHT - 360, "life"))
-            self.collectibles.append(Collectible(970, HEIGHT - 290, "coin"))
-            
-        else:  # Level 3 - Boss level
-            self.platforms.append(Platform(300, HEIGHT - 200, 200, 20))
-            self.platforms.append(Platform(600, HEIGHT - 300, 200, 20))
-            self.platforms.append(Platform(900, HEIGHT - 200, 200, 20))
-            self.platforms.append(Platform(1200, HEIGHT - 300, 200, 20))
-            
-            # Enemies
-            self.enemies.append(Enemy(400, HEIGHT - 260, "shooter"))
-            self.enemies.append(Enemy(700, HEIGHT - 360, "shooter"))
-            self.enemies.append(Enemy(1000, HEIGHT - 260, "shooter"))
-            self.enemies.append(Enemy(1500, HEIGHT - 360, "boss"))
-            
-            # Collectibles
-            self.collectibles.append(Collectible(350, HEIGHT - 240, "health"))
-            self.collectibles.append(Collectible(650, HEIGHT - 340, "health"))
-            self.collectibles.append(Collectible(950, HEIGHT - 240, "life"))
-            self.collectibles.append(Collectible(1250, HEIGHT - 340, "health"))
-            
+        self.enemy_system.clear()
+        self.collectible_system.clear()
+        
+        # Level layout comes from the level file, chunks are loaded as the camera moves
+        self.level_data = load_level(self.level_files[self.level - 1])
+        self.level_width = self.level_data.width
+        self.streamer = ChunkStreamer(self.level_data)
+        self.enemies_left = self.level_data.enemy_count
+        self.boss_defeated = False
+        self.streamer.update(self)
+        
+        # Platforms changed, the cached background tiles are rebuilt when next drawn
+        if self.background:
+            self.platform_changes.append(None)
+        
+    @property
+    def enemies(self):
+        # Views in the entity stores, add and remove entities through the stores
+        return self.enemy_system.views
+    
+    @property
+    def projectiles(self):
+        return self.projectile_system.views
+    
+    @property
+    def collectibles(self):
+        return self.collectible_system.views
+    
+    @property
+    def level_count(self):
+        return len(self.level_files)
+    
     def update_camera(self):
         # Camera follows player with smoothing
         target_x = self.player.x - WIDTH // 3
         self.camera_x += (target_x - self.camera_x) * 0.1
         
         # Keep camera within level bounds
-        self.camera_x = max(0, min(self.camera_x, 5000 - WIDTH))
+        self.camera_x = max(0, min(self.camera_x, self.level_width - WIDTH))
     
-    def handle_input(self):
-        keys = pygame.key.get_pressed()
+    def handle_input(self, inputs):
+        # inputs is a mask of INPUT_* bits, from the keyboard, a script or a recording
+        
+        # While rewinding nothing else is done, the step restores an earlier state instead
+        self.rewinding = bool(inputs & INPUT_REWIND) and self.history is not None
+        if self.rewinding:
+            return
+        
+        # Start from the menu and restart after game over
+        if inputs & INPUT_START:
+            if self.state == MENU:
+                self.state = PLAYING
+            elif self.state == GAME_OVER and self.game_over_timer < 90:
+                self.level = 1
+                self.reset()
+                self.state = PLAYING
         
         # Horizontal movement
         self.player.vel_x = 0
-        if keys[pygame.K_LEFT] or keys[pygame.K_a]:
+        if inputs & INPUT_LEFT:
             self.player.vel_x = -self.player.speed
             self.player.direction = -1
-        if keys[pygame.K_RIGHT] or keys[pygame.K_d]:
+        if inputs & INPUT_RIGHT:
             self.player.vel_x = self.player.speed
             self.player.direction = 1
             
         # Jumping
-        if (keys[pygame.K_SPACE] or keys[pygame.K_w] or keys[pygame.K_UP]) and not self.player.is_jumping:
+        if inputs & INPUT_JUMP and not self.player.is_jumping:
             self.player.jump()
+        
+        # Shooting
+        if inputs & INPUT_SHOOT:
+            if self.state == PLAYING:
+                if self.player.shoot(self.projectile_system):
+                    self.play_sound("shoot")
+    
+    def play_sound(self, name):
+        # The simulation only asks for sounds and the main loop plays them, each sound
+        # once per frame however many times it was asked for (many hits at once)
+        if not self.headless and name not in self.sound_events:
+            self.sound_events.append(name)
+    
+    def save_positions(self):
+        # Keep the previous step's positions so rendering can interpolate
+        self.prev_camera_x = self.camera_x
+        self.player.save_position()
+        self.enemy_system.save_positions()
+        self.projectile_system.save_positions()
+        self.collectible_system.save_positions()
+    
+    def state_checksum(self):
+        # CRC of everything the simulation changes, used to check replays match exactly
+        return zlib.crc32(self.save_state())
+    
+    def run_steps(self, steps):
+        # One simulation step for each INPUT_* mask in steps
+        for inputs in steps:
+            t = time.perf_counter()
+            self.handle_input(inputs)
+            self.profiler.add("input", t)
+            self.update()
+    
+    def save_state(self):
+        # Everything the simulation changes, packed into bytes for load_state()
+        player = self.player
+        return b"".join([
+            self.STATE.pack(self.state, self.level, self.game_over_timer, self.level_complete_timer, self.deaths,
+                            -1 if self.enemies_left is None else self.enemies_left, self.awake_enemies,
+                            self.boss_defeated, self.camera_x, self.prev_camera_x),
+            self.PLAYER_STATE.pack(player.x, player.y, player.vel_x, player.vel_y, player.prev_x, player.prev_y,
+                                   player.health, player.lives, player.score, player.shoot_cooldown,
+                                   player.hurt_timer, player.direction, player.is_jumping),
+            self.enemy_system.save_state(),
+            self.projectile_system.save_state(),
+            self.collectible_system.save_state(),
+            self.streamer.save_state(),
+        ])
+    
+    def load_state(self, data):
+        # Puts the game back in a state from save_state()
+        (self.state, level, self.game_over_timer, self.level_complete_timer, self.deaths, enemies_left,
+         self.awake_enemies, self.boss_defeated, self.camera_x, self.prev_camera_x) = self.STATE.unpack_from(data)
+        offset = self.STATE.size
+        self.enemies_left = None if enemies_left < 0 else enemies_left
+        if level != self.level:
+            # Past the last level (victory) the last level's data stays loaded
+            self.level = level
+            self.level_data = load_level(self.level_files[min(level, self.level_count) - 1])
+            self.level_width = self.level_data.width
+            self.streamer = ChunkStreamer(self.level_data)
+        
+        player = self.player
+        (player.x, player.y, player.vel_x, player.vel_y, player.prev_x, player.prev_y, player.health,
+         player.lives, player.score, player.shoot_cooldown, player.hurt_timer, player.direction,
+         player.is_jumping) = self.PLAYER_STATE.unpack_from(data, offset)
+        offset += self.PLAYER_STATE.size
+        
+        offset = self.enemy_system.load_state(data, offset)
+        self.enemy_system.awake_count = self.awake_enemies
+        offset = self.projectile_system.load_state(data, offset)
+        offset = self.collectible_system.load_state(data, offset)
+        self.streamer.load_state(self, data, offset)
     
     def update(self):
+        # Rewinding steps back through the history instead of simulating
+        if self.rewinding:
+            data = self.history.pop()
+            if data is not None:
+                self.load_state(data)
+            return
+        
+        self.save_positions()
+        
+        profiler = self.profiler
+        update_start = t = time.perf_counter()
+        
         if self.state == PLAYING:
             # Update player
-            self.player.move(self.platforms)
+            self.player.move(self.platforms, self.level_width)
             
             # Update camera
             self.update_camera()
+            t = profiler.add("player", t)
             
-            # Update projectiles
-            for proj in self.projectiles[:]:
-                proj.move()
-                if proj.is_off_screen(self.camera_x):
-                    self.projectiles.remove(proj)
+            # Stream chunks in and out around the camera
+            changed = self.streamer.update(self)
+            if changed and self.background:
+                self.platform_changes.append(changed)
+            t = profiler.add("streaming", t)
             
-            # Update enemies
-            for enemy in self.enemies:
-                enemy.move(self.platforms, self.player.x)
-                
-                # Enemy shooting
-                if random.random() < 0.02 and enemy.enemy_type in ["shooter", "boss"]:
-                    new_proj = enemy.shoot(self.player.x, self.player.y)
-                    if new_proj:
-                        self.projectiles.append(new_proj)
+            # Update projectiles, all at once
+            self.projectile_system.update(self.camera_x)
+            t = profiler.add("projectiles", t)
+            
+            # Update enemies, all at once, and let them shoot
+            if self.enemy_system.update(self.platforms, self.player, self.level_width, self.projectile_system):
+                self.play_sound("shoot")
+            self.awake_enemies = self.enemy_system.awake_count
+            t = profiler.add("enemies", t)
             
             # Update collectibles
-            for collectible in self.collectibles:
-                collectible.update()
+            self.collectible_system.update()
+            t = profiler.add("collectibles", t)
             
             # Check collisions
             self.check_collisions()
+            t = profiler.add("collisions", t)
             
             # Check level completion
-            if self.level == 3:
+            goal = self.level_data.goal
+            if goal == "boss":
                 # Boss level - check if boss is defeated
-                boss_exists = any(e.enemy_type == "boss" for e in self.enemies)
-                if not boss_exists:
-                    self.state = LEVEL_COMPLETE
-                    self.level_complete_timer = 180
+                complete = self.boss_defeated
+            elif goal == "reach_end":
+                complete = self.player.x >= self.level_width - self.player.width - 10
             else:
-                # Normal level - check if all enemies are defeated
-                if len(self.enemies) == 0:
-                    self.state = LEVEL_COMPLETE
-                    self.level_complete_timer = 180
+                # Normal level - check if all enemies are defeated, loaded or not
+                complete = self.enemies_left == 0
+            if complete:
+                self.state = LEVEL_COMPLETE
+                self.level_complete_timer = 180
             
             # Check game over
             if self.player.health <= 0:
                 self.player.lives -= 1
+                self.deaths += 1
                 if self.player.lives <= 0:
                     self.state = GAME_OVER
                     self.game_over_timer = 180
@@ -534,12 +2329,13 @@ class Game:
                     self.player.health = 100
                     self.player.x = 200
                     self.player.y = 300
+                    self.player.save_position()
         
         elif self.state == LEVEL_COMPLETE:
             self.level_complete_timer -= 1
             if self.level_complete_timer <= 0:
                 self.level += 1
-                if self.level > 3:
+                if self.level > self.level_count:
                     self.state = GAME_OVER
                     self.game_over_timer = 180
                 else:
@@ -548,239 +2344,1204 @@ class Game:
         
         elif self.state == GAME_OVER:
             self.game_over_timer -= 1
+        
+        # Keep this step for rewinding
+        if self.history is not None:
+            t = time.perf_counter()
+            self.history.push(self.save_state())
+            profiler.add("snapshot", t)
+        
+        profiler.add("update", update_start)
     
     def check_collisions(self):
+        player = self.player
+        
         # Player with collectibles
-        for collectible in self.collectibles[:]:
-            if self.player.check_collision(collectible):
-                if collectible.collectible_type == "health":
-                    self.player.health = min(100, self.player.health + 30)
-                elif collectible.collectible_type == "life":
-                    self.player.lives += 1
+        collectibles = self.collectible_system
+        picked = collectibles.overlapping(player)
+        if picked:
+            for code in collectibles.type_code[picked].tolist():
+                if COLLECTIBLE_TYPES[code] == "health":
+                    player.health = min(100, player.health + 30)
+                elif COLLECTIBLE_TYPES[code] == "life":
+                    player.lives += 1
                 else:  # coin
-                    self.player.score += 100
-                self.collectibles.remove(collectible)
+                    player.score += 100
+            collectibles.discard_at(picked)
+            self.play_sound("pickup")
         
         # Player with enemies
-        for enemy in self.enemies:
-            if self.player.check_collision(enemy) and self.player.hurt_timer == 0:
-                self.player.health -= 10
-                self.player.hurt_timer = 30
-        
-        # Projectiles with enemies
-        for proj in self.projectiles[:]:
-            if proj.owner == "player":
-                for enemy in self.enemies[:]:
-                    dx = proj.x - (enemy.x + enemy.width//2)
-                    dy = proj.y - (enemy.y + enemy.height//2)
-                    distance = math.sqrt(dx*dx + dy*dy)
-                    
-                    if distance < proj.radius + max(enemy.width, enemy.height)//2:
-                        enemy.health -= 10
-                        enemy.hurt_timer = 5
-                        if proj in self.projectiles:
-                            self.projectiles.remove(proj)
-                        if enemy.health <= 0:
-                            self.enemies.remove(enemy)
-                            self.player.score += 50 if enemy.enemy_type != "boss" else 500
-                        break
-        
-        # Projectiles with player
-        for proj in self.projectiles[:]:
-            if proj.owner == "enemy":
-                dx = proj.x - (self.player.x + self.player.width//2)
-                dy = proj.y - (self.player.y + self.player.height//2)
-                distance = math.sqrt(dx*dx + dy*dy)
-                
-                if distance < proj.radius + self.player.width//2 and self.player.hurt_timer == 0:
-                    self.player.health -= 15
-                    self.player.hurt_timer = 30
-                    if proj in self.projectiles:
-                        self.projectiles.remove(proj)
+        if player.hurt_timer == 0 and self.enemy_system.overlapping(player):
+            player.health -= 10
+            player.hurt_timer = 30
+            self.play_sound("hit")
+        
+        # Projectiles with enemies. Only those within reach of some enemy are checked one
+        # by one, in order, as each hit can change which enemies are left.
+        projectiles = self.projectile_system
+        if projectiles.count == 0:
+            return
+        spent = []
+        near = self.enemy_system.reached_by(projectiles)
+        x, y = (projectiles.x.tolist(), projectiles.y.tolist()) if near else (None, None)
+        for index in near:
+            enemy = self.enemy_system.hit_by(x[index], y[index], ProjectileSystem.RADIUS)
+            if enemy is not None:
+                enemy.health -= 10
+                enemy.hurt_timer = 5
+                spent.append(index)
+                self.play_sound("hit")
+                if enemy.health <= 0:
+                    is_boss = enemy.type_code == ENEMY_BOSS
+                    self.enemy_system.remove(enemy)
+                    player.score += 500 if is_boss else 50
+                    if self.enemies_left is not None:
+                        self.enemies_left -= 1
+                    if is_boss:
+                        self.boss_defeated = True
+                        self.play_sound("boss")
+        
+        # Projectiles with player, the first one to hit hurts and the player is then immune
+        if player.hurt_timer == 0:
+            hits = projectiles.hits("enemy", player.x + player.width//2, player.y + player.height//2,
+                                    ProjectileSystem.RADIUS + player.width//2)
+            if hits:
+                player.health -= 15
+                player.hurt_timer = 30
+                self.play_sound("hit")
+                spent.append(hits[0])
+        
+        projectiles.discard_at(spent)
     
-    def draw(self):
-        # Draw background
-        screen.fill(BACKGROUND)
+    def draw(self, alpha=1.0, frame=None):
+        # Returns the screen areas to update, or None when the whole frame changed.
+        # alpha is how far rendering is between the last two simulation steps.
+        # frame is a FrameSnapshot to draw instead of the game's own live state.
+        frame = frame or self
+        camera_x = int(lerp(frame.prev_camera_x, frame.camera_x, alpha))
         
-        # Draw distant mountains (for parallax effect)
-        for i in range(5):
-            height = 150 + i*20
-            pygame.draw.polygon(screen, (100, 120, 140), [
-                (i*300 - self.camera_x*0.2, HEIGHT),
-                (i*300 - self.camera_x*0.2, HEIGHT - height),
-                ((i+1)*300 - self.camera_x*0.2, HEIGHT - height - 50),
-                ((i+1)*300 - self.camera_x*0.2, HEIGHT)
-            ])
+        # Bring the cached background tiles up to date with streamed platforms
+        for x_range in frame.platform_changes:
+            self.background.set_platforms(frame.platforms, x_range)
+            if x_range is None:
+                self.last_draw = None
+        frame.platform_changes = []
+        
+        # With an unchanged camera only the areas entities moved through need repainting
+        partial = DIRTY_RECTS and frame.state == PLAYING and self.last_draw == (camera_x, frame.state)
+        self.last_draw = (camera_x, frame.state)
         
-        # Draw platforms
-        for platform in self.platforms:
-            platform.draw(screen, self.camera_x)
+        profiler = self.profiler
+        draw_start = t = time.perf_counter()
         
-        # Draw collectibles
-        for collectible in self.collectibles:
-            collectible.draw(screen, self.camera_x)
+        # Redraw HUD values that changed
+        self.update_hud(frame)
         
-        # Draw enemies
-        for enemy in self.enemies:
-            enemy.draw(screen, self.camera_x)
+        # Remember where entities are so they can be erased next frame
+        previous = self.dirty_rects
+        if DIRTY_RECTS:
+            self.dirty_rects = [e.get_draw_rect(camera_x, alpha) for e in frame.collectibles]
+            self.dirty_rects += [e.get_draw_rect(camera_x, alpha) for e in frame.enemies]
+            self.dirty_rects += [p.get_draw_rect(camera_x, alpha) for p in frame.projectiles]
+            self.dirty_rects.append(frame.player.get_draw_rect(camera_x, alpha))
         
-        # Draw projectiles
-        for proj in self.projectiles:
-            proj.draw(screen, self.camera_x)
+        # Draw background and platforms. A partial repaint covers where entities were and
+        # are now, merged so that no area gets the semi-transparent HUD blitted twice.
+        dirty = None
+        if partial:
+            dirty = merge_rects(previous + self.dirty_rects + self.hud.dirty)
+            for rect in dirty:
+                self.background.draw(screen, camera_x, rect, self.quality < 3)
+        else:
+            self.background.draw(screen, camera_x, mountains=self.quality < 3)
+        t = profiler.add("background", t)
         
-        # Draw player
-        self.player.draw(screen, self.camera_x)
+        # Queue every sprite, then draw them from the atlas layer by layer
+        queue = self.render_queue
+        queue.add_collectibles(frame.collectible_system, camera_x, alpha)
+        queue.add_enemies(frame.enemy_system, camera_x, alpha, self.quality < 1)
+        queue.add_projectiles(frame.projectile_system, camera_x, alpha)
+        frame.player.submit(queue, camera_x, alpha, self.quality >= 2)
+        queue.flush(screen)
+        t = profiler.add("entities", t)
         
         # Draw HUD
-        self.draw_hud()
+        self.draw_hud(frame, dirty)
         
         # Draw game state overlays
-        if self.state == MENU:
+        if frame.state == MENU:
             self.draw_menu()
-        elif self.state == GAME_OVER:
-            self.draw_game_over()
-        elif self.state == LEVEL_COMPLETE:
-            self.draw_level_complete()
+        elif frame.state == GAME_OVER:
+            self.draw_game_over(frame)
+        elif frame.state == LEVEL_COMPLETE:
+            self.draw_level_complete(frame)
+        profiler.add("hud", t)
+        profiler.add("draw", draw_start)
+        
+        return dirty
+    
+    def entity_counts(self):
+        return {
+            "enemies": len(self.enemies),
+            "awake": self.awake_enemies,
+            "projectiles": len(self.projectiles),
+            "collectibles": len(self.collectibles),
+            "platforms": len(self.platforms),
+        }
     
-    def draw_hud(self):
+    def update_hud(self, frame):
+        hud = self.hud
+        player = frame.player
+        hud.dirty = []
+        
         # Health bar
-        pygame.draw.rect(screen, (100, 100, 100), (20, 20, 204, 24))
-        pygame.draw.rect(screen, RED, (22, 22, 200 * self.player.health / 100, 20))
-        health_text = font_small.render(f"HEALTH: {self.player.health}", True, WHITE)
-        screen.blit(health_text, (30, 22))
+        def draw_health(strip):
+            pygame.draw.rect(strip, (100, 100, 100), (20, 20, 204, 24))
+            pygame.draw.rect(strip, RED, (22, 22, 200 * player.health / 100, 20))
+            strip.blit(hud.text(font_small, f"HEALTH: {player.health}", WHITE), (30, 22))
+            return pygame.Rect(20, 20, 204, 24)
+        hud.update_region("health", player.health, draw_health)
         
         # Lives
-        lives_text = font_small.render(f"LIVES: {self.player.lives}", True, WHITE)
-        screen.blit(lives_text, (250, 22))
+        def draw_lives(strip):
+            lives_text = hud.text(font_small, f"LIVES: {player.lives}", WHITE)
+            return strip.blit(lives_text, (250, 22))
+        hud.update_region("lives", player.lives, draw_lives)
         
         # Score
-        score_text = font_small.render(f"SCORE: {self.player.score}", True, WHITE)
-        screen.blit(score_text, (WIDTH - 200, 22))
+        def draw_score(strip):
+            score_text = hud.text(font_small, f"SCORE: {player.score}", WHITE)
+            return strip.blit(score_text, (WIDTH - 200, 22))
+        hud.update_region("score", player.score, draw_score)
         
         # Level
-        level_text = font_small.render(f"LEVEL: {self.level}/3", True, WHITE)
-        screen.blit(level_text, (WIDTH // 2 - 50, 22))
+        def draw_level(strip):
+            level_text = hud.text(font_small, f"LEVEL: {frame.level}/{frame.level_count}", WHITE)
+            return strip.blit(level_text, (WIDTH // 2 - 50, 22))
+        hud.update_region("level", frame.level, draw_level)
+        
+        # Reduced detail, nothing while at full detail
+        def draw_quality(strip):
+            if self.quality == 0:
+                return pygame.Rect(0, 0, 0, 0)
+            quality_text = hud.text(font_small, f"LOW DETAIL: {self.quality}", WHITE)
+            return strip.blit(quality_text, (WIDTH // 2 + 90, 22))
+        hud.update_region("quality", self.quality, draw_quality)
+    
+    def draw_hud(self, frame, areas=None):
+        # When only some areas were repainted, the HUD is only blitted over those
+        # so its semi-transparent text edges don't build up frame after frame
+        hud = self.hud
+        hud.blit_areas(screen, hud.strip, (0, 0), areas)
         
         # Controls hint
-        if self.state == PLAYING:
-            controls = font_small.render("ARROWS: Move | SPACE: Jump | F: Shoot", True, WHITE)
-            screen.blit(controls, (WIDTH // 2 - 150, HEIGHT - 40))
+        if frame.state == PLAYING:
+            controls = hud.text(font_small, "ARROWS: Move | SPACE: Jump | F: Shoot", WHITE)
+            hud.blit_areas(screen, controls, (WIDTH // 2 - 150, HEIGHT - 40), areas)
     
     def draw_menu(self):
-        # Semi-transparent overlay
-        overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-        overlay.fill((0, 0, 0, 180))
-        screen.blit(overlay, (0, 0))
-        
-        # Title
-        title = font_large.render("ANIMAL HERO", True, YELLOW)
-        screen.blit(title, (WIDTH//2 - title.get_width()//2, HEIGHT//4))
-        
-        # Subtitle
-        subtitle = font_medium.render("vs Human Enemies", True, WHITE)
-        screen.blit(subtitle, (WIDTH//2 - subtitle.get_width()//2, HEIGHT//4 + 70))
-        
-        # Instructions
-        start_text = font_medium.render("Press SPACE to Start", True, GREEN)
-        screen.blit(start_text, (WIDTH//2 - start_text.get_width()//2, HEIGHT//2 + 50))
-        
-        controls = font_small.render("Controls: Arrow Keys to Move, SPACE to Jump, F to Shoot", True, WHITE)
-        screen.blit(controls, (WIDTH//2 - controls.get_width()//2, HEIGHT//2 + 120))
-        
-        # Character preview
-        pygame.draw.circle(screen, (255, 140, 0), (WIDTH//2 - 150, HEIGHT//2), 40)
-        pygame.draw.circle(screen, BLUE, (WIDTH//2 + 150, HEIGHT//2), 40)
-    
-    def draw_game_over(self):
-        # Semi-transparent overlay
-        overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-        overlay.fill((0, 0, 0, 200))
-        screen.blit(overlay, (0, 0))
-        
-        # Game over text
-        if self.level > 3:
-            text = font_large.render("VICTORY!", True, GREEN)
-        else:
-            text = font_large.render("GAME OVER", True, RED)
-        screen.blit(text, (WIDTH//2 - text.get_width()//2, HEIGHT//3))
-        
-        # Score
-        score_text = font_medium.render(f"Final Score: {self.player.score}", True, YELLOW)
-        screen.blit(score_text, (WIDTH//2 - score_text.get_width()//2, HEIGHT//2))
+        hud = self.hud
         
-        # Restart prompt
-        if self.game_over_timer < 90:
-            restart_text = font_medium.render("Press R to Restart", True, GREEN)
-            screen.blit(restart_text, (WIDTH//2 - restart_text.get_width()//2, HEIGHT//2 + 80))
+        # Semi-transparent overlay, composed once and reused
+        if hud.begin_overlay((MENU,), 180):
+            # Title
+            hud.blit_centered(hud.text(font_large, "ANIMAL HERO", YELLOW), HEIGHT//4)
+            
+            # Subtitle
+            hud.blit_centered(hud.text(font_medium, "vs Human Enemies", WHITE), HEIGHT//4 + 70)
+            
+            # Instructions
+            hud.blit_centered(hud.text(font_medium, "Press SPACE to Start", GREEN), HEIGHT//2 + 50)
+            
+            controls = hud.text(font_small, "Controls: Arrow Keys to Move, SPACE to Jump, F to Shoot", WHITE)
+            hud.blit_centered(controls, HEIGHT//2 + 120)
+            
+            # Character preview
+            pygame.draw.circle(hud.overlay, (255, 140, 0), (WIDTH//2 - 150, HEIGHT//2), 40)
+            pygame.draw.circle(hud.overlay, BLUE, (WIDTH//2 + 150, HEIGHT//2), 40)
         
-        # Level reached
-        level_text = font_small.render(f"Level Reached: {min(self.level, 3)}/3", True, WHITE)
-        screen.blit(level_text, (WIDTH//2 - level_text.get_width()//2, HEIGHT//2 + 150))
+        hud.blit_overlay(screen)
     
-    def draw_level_complete(self):
-        # Semi-transparent overlay
-        overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-        overlay.fill((0, 0, 0, 150))
-        screen.blit(overlay, (0, 0))
-        
-        # Level complete text
-        text = font_large.render(f"LEVEL {self.level} COMPLETE!", True, GREEN)
-        screen.blit(text, (WIDTH//2 - text.get_width()//2, HEIGHT//3))
+    def draw_game_over(self, frame):
+        hud = self.hud
+        player = frame.player
+        show_restart = frame.game_over_timer < 90
         
-        # Score
-        score_text = font_medium.render(f"Score: {self.player.score}", True, YELLOW)
-        screen.blit(score_text, (WIDTH//2 - score_text.get_width()//2, HEIGHT//2))
-        
-        # Next level prompt
-        if self.level_complete_timer < 120:
-            if self.level < 3:
-                next_text = font_medium.render("Get ready for next level...", True, WHITE)
-                screen.blit(next_text, (WIDTH//2 - next_text.get_width()//2, HEIGHT//2 + 80))
+        # Only recompose the overlay when something on it changes
+        if hud.begin_overlay((GAME_OVER, frame.level, player.score, show_restart), 200):
+            # Game over text
+            if frame.level > frame.level_count:
+                text = hud.text(font_large, "VICTORY!", GREEN)
             else:
-                next_text = font_medium.render("Get ready for the FINAL BATTLE!", True, RED)
-                screen.blit(next_text, (WIDTH//2 - next_text.get_width()//2, HEIGHT//2 + 80))
-
-# Create game instance
-game = Game()
-
-# Main game loop
-clock = pygame.time.Clock()
-running = True
-
-while running:
-    # Event handling
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-        
-        if event.type == pygame.KEYDOWN:
-            if event.key == pygame.K_SPACE:
-                if game.state == MENU:
-                    game.state = PLAYING
+                text = hud.text(font_large, "GAME OVER", RED)
+            hud.blit_centered(text, HEIGHT//3)
+            
+            # Score
+            score_text = hud.text(font_medium, f"Final Score: {player.score}", YELLOW)
+            hud.blit_centered(score_text, HEIGHT//2)
             
-            if event.key == pygame.K_r:
-                if game.state == GAME_OVER and game.game_over_timer < 90:
-                    game.level = 1
-                    game.reset()
-                    game.state = PLAYING
+            # Restart prompt
+            if show_restart:
+                hud.blit_centered(hud.text(font_medium, "Press R to Restart", GREEN), HEIGHT//2 + 80)
             
-            if event.key == pygame.K_f and game.state == PLAYING:
-                new_proj = game.player.shoot()
-                if new_proj:
-                    game.projectiles.append(new_proj)
+            # Level reached
+            level_text = hud.text(font_small, f"Level Reached: {min(frame.level, frame.level_count)}/{frame.level_count}", WHITE)
+            hud.blit_centered(level_text, HEIGHT//2 + 150)
+        
+        hud.blit_overlay(screen)
     
-    # Update game state
-    game.handle_input()
-    game.update()
+    def draw_level_complete(self, frame):
+        hud = self.hud
+        player = frame.player
+        show_next = frame.level_complete_timer < 120
+        
+        if hud.begin_overlay((LEVEL_COMPLETE, frame.level, player.score, show_next), 150):
+            # Level complete text
+            hud.blit_centered(hud.text(font_large, f"LEVEL {frame.level} COMPLETE!", GREEN), HEIGHT//3)
+            
+            # Score
+            score_text = hud.text(font_medium, f"Score: {player.score}", YELLOW)
+            hud.blit_centered(score_text, HEIGHT//2)
+            
+            # Next level prompt
+            if show_next:
+                if frame.level < frame.level_count:
+                    next_text = hud.text(font_medium, "Get ready for next level...", WHITE)
+                else:
+                    next_text = hud.text(font_medium, "Get ready for the FINAL BATTLE!", RED)
+                hud.blit_centered(next_text, HEIGHT//2 + 80)
+        
+        hud.blit_overlay(screen)
+
+def clone(entity):
+    # Shallow copy of a __slots__ entity, cheaper than copy.copy
+    copy = object.__new__(type(entity))
+    for name in type(entity).__slots__:
+        setattr(copy, name, getattr(entity, name))
+    return copy
+
+class FrameSnapshot:
+    # Everything Game.draw reads from the simulation, copied after the last step of a
+    # frame so it can be drawn while the simulation moves on. The entity stores are
+    # copied into stores owned by the snapshot, and its views read from those.
+    def __init__(self):
+        self.enemy_system = EnemySystem(0)
+        self.projectile_system = ProjectileSystem()
+        self.collectible_system = CollectibleSystem()
+        self.platform_changes = []
+        self.sound_events = []
     
-    # Draw everything
-    game.draw()
+    def capture(self, game):
+        self.state = game.state
+        self.level = game.level
+        self.level_count = game.level_count
+        self.camera_x = game.camera_x
+        self.prev_camera_x = game.prev_camera_x
+        self.game_over_timer = game.game_over_timer
+        self.level_complete_timer = game.level_complete_timer
+        self.platforms = game.platforms  # replaced, never changed in place, by streaming
+        self.player = clone(game.player)
+        self.enemy_system.copy_from(game.enemy_system)
+        self.projectile_system.copy_from(game.projectile_system)
+        self.collectible_system.copy_from(game.collectible_system)
+        self.enemies = self.enemy_system.views
+        self.projectiles = self.projectile_system.views
+        self.collectibles = self.collectible_system.views
+        
+        # The snapshot takes over the background updates and sounds still to be played
+        self.platform_changes = game.platform_changes
+        game.platform_changes = []
+        self.sound_events = game.sound_events
+        game.sound_events = []
+        return self
+
+class SimulationThread:
+    # Runs the simulation on a worker thread one frame ahead of rendering. Each frame
+    # the main thread hands over that frame's inputs with submit(), draws the snapshot
+    # it collected last frame, then waits for the next one with collect(). The two
+    # snapshot buffers alternate, so the worker never writes the one being drawn, and
+    # the game itself is only touched by the worker between submit() and collect().
+    def __init__(self, game):
+        self.game = game
+        self.buffers = [FrameSnapshot().capture(game), FrameSnapshot()]
+        self.front = 0  # buffer being drawn
+        self.jobs = queue.Queue(maxsize=1)
+        self.results = queue.Queue(maxsize=1)
+        self.thread = threading.Thread(target=self.run, name="simulation", daemon=True)
+        self.thread.start()
+    
+    @property
+    def frame(self):
+        return self.buffers[self.front]
+    
+    def run(self):
+        while True:
+            steps = self.jobs.get()
+            if steps is None:
+                return
+            try:
+                self.game.run_steps(steps)
+                result = self.buffers[1 - self.front].capture(self.game)
+            except Exception as error:
+                result = error
+            self.results.put(result)
+    
+    def submit(self, steps):
+        self.jobs.put(steps)
+    
+    def collect(self):
+        # Waits for the submitted steps and swaps in their snapshot
+        result = self.results.get()
+        if isinstance(result, Exception):
+            raise result
+        self.front = 1 - self.front
+        return result
+    
+    def stop(self):
+        self.jobs.put(None)
+        self.thread.join()
+
+class Recording:
+    # A seed and the level files plus one byte of INPUT_* bits per simulation step
+    # reproduces a whole session
+    MAGIC = b"AHRC"
+    VERSION = 8
+    HEADER = struct.Struct("<4sBQBBIIH")  # ends with the length of the level file names
+    
+    def __init__(self, seed, level=1, state=MENU, level_files=None):
+        self.seed = seed
+        self.level = level
+        self.state = state
+        self.level_files = list(level_files or LEVEL_FILES)
+        self.inputs = bytearray()
+        self.checksum = 0  # Game.state_checksum() after the last step
+    
+    def record(self, inputs):
+        self.inputs.append(inputs)
+    
+    def new_game(self, headless=False, history=None):
+        # A game in the exact starting state of the recording, which can rewind if the recording
+        # does. history=False keeps no more history than that, even with a window
+        rewind = any(inputs & INPUT_REWIND for inputs in self.inputs)
+        if history is None:
+            history = not headless
+        game = Game(headless=headless, seed=self.seed, level_files=self.level_files, rewind=rewind or history)
+        if self.level != game.level:
+            game.level = self.level
+            game.reset()
+        game.state = self.state
+        return game
+    
+    def save(self, path):
+        names = "\n".join(self.level_files).encode()
+        header = self.HEADER.pack(self.MAGIC, self.VERSION, self.seed, self.level, self.state,
+                                  len(self.inputs), self.checksum, len(names))
+        with open(path, "wb") as f:
+            f.write(header + names + zlib.compress(bytes(self.inputs), 9))
+    
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, seed, level, state, frames, checksum, names_size = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            raise ValueError(f"{path} is not a recording this version can play")
+        offset = cls.HEADER.size + names_size
+        level_files = data[cls.HEADER.size:offset].decode().split("\n")
+        recording = cls(seed, level, state, level_files)
+        recording.inputs = bytearray(zlib.decompress(data[offset:]))
+        recording.checksum = checksum
+        if len(recording.inputs) != frames:
+            raise ValueError(f"{path} is truncated")
+        return recording
+
+def replay(recording, game=None):
+    # Plays a recording back step by step, returns the game and whether it matched
+    if game is None:
+        game = recording.new_game(headless=True)
+    for inputs in recording.inputs:
+        game.handle_input(inputs)
+        game.update()
+    return game, game.state_checksum() == recording.checksum
+
+# Scripted inputs for headless runs, each returns the INPUT_* bits for a frame
+def idle_script(frame, game):
+    return 0
+
+def run_and_gun_script(frame, game):
+    inputs = INPUT_RIGHT
+    if frame % 10 == 0:
+        inputs |= INPUT_SHOOT
+    if frame % 45 == 0:
+        inputs |= INPUT_JUMP
+    return inputs
+
+def hunter_script(frame, game):
+    # Walk up to the nearest enemy, face it and keep shooting
+    player = game.player
+    if not game.enemies:
+        return INPUT_RIGHT
+    target = min(game.enemies, key=lambda e: abs(e.x - player.x))
+    
+    inputs = 0
+    if target.x < player.x - 150:
+        inputs |= INPUT_LEFT
+    elif target.x > player.x + 150:
+        inputs |= INPUT_RIGHT
+    elif (target.x - player.x) * player.direction < 0:
+        inputs |= INPUT_LEFT if target.x < player.x else INPUT_RIGHT
+    
+    if frame % 5 == 0:
+        inputs |= INPUT_SHOOT
+    if target.y < player.y - 40 and frame % 30 == 0:
+        inputs |= INPUT_JUMP
+    return inputs
+
+SCRIPTS = {
+    "idle": idle_script,
+    "run-and-gun": run_and_gun_script,
+    "hunter": hunter_script,
+}
+
+def run_simulation(job):
+    # Plays one game without a window as fast as possible and reports how it went
+    seed, script_name, frames, level_files = job
+    script = SCRIPTS[script_name]
+    
+    game = Game(headless=True, seed=seed, level_files=level_files)
+    game.state = PLAYING
+    
+    start = time.perf_counter()
+    frame = 0
+    while frame < frames and game.state != GAME_OVER:
+        game.handle_input(script(frame, game))
+        game.update()
+        frame += 1
+    elapsed = time.perf_counter() - start
+    
+    return {
+        "seed": seed,
+        "script": script_name,
+        "frames": frame,
+        "score": game.player.score,
+        "deaths": game.deaths,
+        "level": min(game.level, game.level_count),
+        "won": game.level > game.level_count,
+        "fps": frame / elapsed if elapsed > 0 else 0,
+    }
+
+def run_headless(args):
+    # No window is ever opened, but keep SDL away from real devices just in case
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    
+    jobs = [(args.seed + i, args.script, args.frames, args.levels) for i in range(args.runs)]
+    start = time.perf_counter()
+    if args.workers > 1:
+        with multiprocessing.Pool(args.workers) as pool:
+            results = pool.map(run_simulation, jobs)
+    else:
+        results = [run_simulation(job) for job in jobs]
+    elapsed = time.perf_counter() - start
+    
+    print(f"{'seed':>6} {'frames':>7} {'score':>6} {'deaths':>6} {'level':>5} {'won':>5} {'fps':>9}")
+    for result in results:
+        print(f"{result['seed']:>6} {result['frames']:>7} {result['score']:>6} {result['deaths']:>6} "
+              f"{result['level']:>5} {str(result['won']):>5} {result['fps']:>9.0f}")
+    
+    total_frames = sum(result["frames"] for result in results)
+    print(f"{len(results)} runs, {total_frames} frames in {elapsed:.2f}s "
+          f"({total_frames / elapsed:.0f} frames/s over {args.workers} workers)")
+
+# Canned sessions for the replay benchmark: (start level, input script, frames)
+BENCH_SESSIONS = {
+    "normal": (1, "hunter", 1800),
+    "boss": (3, "hunter", 1800),
+    "projectiles": (3, "idle-shooting", 1800),
+}
+
+def idle_shooting_script(frame, game):
+    # Stand in the middle of level 3 so every shooter keeps firing
+    return INPUT_SHOOT
+
+SCRIPTS["idle-shooting"] = idle_shooting_script
+
+def make_bench_recording(name, seed=1234):
+    level, script_name, frames = BENCH_SESSIONS[name]
+    recording = Recording(seed, level, PLAYING)
+    game = recording.new_game(headless=True)
+    script = SCRIPTS[script_name]
+    for frame in range(frames):
+        inputs = script(frame, game)
+        recording.record(inputs)
+        game.handle_input(inputs)
+        game.update()
+    recording.checksum = game.state_checksum()
+    return recording
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return {"p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99), "max": ordered[-1] * 1000}
+
+def run_replay_bench(args):
+    # Replays canned sessions headlessly and reports per-frame update/draw times in ms
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    init_display()
+    
+    sessions = [(name, make_bench_recording(name)) for name in BENCH_SESSIONS]
+    sessions += [(path, Recording.load(path)) for path in args.bench_replay]
+    
+    report = {}
+    for name, recording in sessions:
+        # Without rewind snapshots, so update times stay comparable with earlier runs
+        game = recording.new_game(history=False)
+        update_times = []
+        draw_times = []
+        for inputs in recording.inputs:
+            start = time.perf_counter()
+            game.handle_input(inputs)
+            game.update()
+            middle = time.perf_counter()
+            game.draw()
+            end = time.perf_counter()
+            update_times.append(middle - start)
+            draw_times.append(end - middle)
+        
+        report[name] = {
+            "frames": len(recording.inputs),
+            "matched": game.state_checksum() == recording.checksum,
+            "update_ms": percentiles(update_times),
+            "draw_ms": percentiles(draw_times),
+        }
+    
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    
+    print(f"{'session':<14} {'frames':>6} {'match':>5}  {'update p50/p90/p99/max (ms)':<30} {'draw p50/p90/p99/max (ms)':<30}")
+    for name, result in report.items():
+        times = []
+        for key in ("update_ms", "draw_ms"):
+            t = result[key]
+            times.append(f"{t['p50']:.3f}/{t['p90']:.3f}/{t['p99']:.3f}/{t['max']:.3f}")
+        print(f"{os.path.basename(name):<14} {result['frames']:>6} {str(result['matched']):>5}  {times[0]:<30} {times[1]:<30}")
+
+def run_rewind_bench(args):
+    # Replays the canned sessions headlessly, timing a rewind snapshot after every step,
+    # then how long each step back takes, and reports the memory the history uses
+    report = {}
+    for name in BENCH_SESSIONS:
+        recording = make_bench_recording(name)
+        game = recording.new_game(headless=True)
+        history = RewindBuffer()
+        snapshot_times = []
+        state_bytes = 0
+        for inputs in recording.inputs:
+            game.handle_input(inputs)
+            game.update()
+            start = time.perf_counter()
+            data = game.save_state()
+            history.push(data)
+            snapshot_times.append(time.perf_counter() - start)
+            state_bytes += len(data)
+        steps, history_bytes = len(history), history.bytes
+        
+        restore_times = []
+        while True:
+            start = time.perf_counter()
+            data = history.pop()
+            if data is None:
+                break
+            game.load_state(data)
+            restore_times.append(time.perf_counter() - start)
+        
+        report[name] = {
+            "frames": len(recording.inputs),
+            "state_bytes": state_bytes / len(recording.inputs),
+            "stored_bytes": history_bytes / steps,
+            "history_steps": steps,
+            "history_kb": history_bytes / 1024,
+            "snapshot_ms": percentiles(snapshot_times),
+            "restore_ms": percentiles(restore_times),
+        }
+    
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    
+    print(f"{'session':<12} {'state B':>8} {'stored B':>8} {'history':>14}  "
+          f"{'snapshot p50/p99/max (ms)':<26} {'restore p50/p99/max (ms)':<26}")
+    for name, result in report.items():
+        times = []
+        for key in ("snapshot_ms", "restore_ms"):
+            t = result[key]
+            times.append(f"{t['p50']:.3f}/{t['p99']:.3f}/{t['max']:.3f}")
+        history = f"{result['history_kb']:.0f} KB/{result['history_steps']}"
+        print(f"{name:<12} {result['state_bytes']:>8.0f} {result['stored_bytes']:>8.0f} {history:>14}  "
+              f"{times[0]:<26} {times[1]:<26}")
+
+# Stress test: how many of each kind are spawned per entity count N
+STRESS_MIX = {
+    "normal": 1.0,
+    "shooter": 1.0,
+    "boss": 0.1,
+    "projectiles": 1.0,
+    "collectibles": 0.5,
+    "platforms": 0.2,
+}
+
+def stress_mix(text):
+    # --stress-mix value: STRESS_MIX with the shares given as kind=share,... replaced
+    mix = dict(STRESS_MIX)
+    for item in text.split(","):
+        kind, _, share = item.partition("=")
+        kind = kind.strip()
+        if kind not in mix:
+            raise argparse.ArgumentTypeError(f"unknown kind {kind!r}, expected one of {', '.join(mix)}")
+        try:
+            mix[kind] = float(share)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"{kind} needs a number, as in {kind}=0.5") from None
+        if mix[kind] < 0:
+            raise argparse.ArgumentTypeError(f"{kind} can't be negative")
+    return mix
+
+def fill_stress_game(game, targets, rng):
+    # Tops every kind back up to its target count around the visible screen
+    left = game.camera_x
+    for enemy_type in ENEMY_TYPES:
+        missing = targets[enemy_type] - sum(1 for e in game.enemies if e.enemy_type == enemy_type)
+        for _ in range(missing):
+            game.enemy_system.spawn(left + rng.uniform(0, WIDTH), rng.uniform(100, HEIGHT - 120), enemy_type)
+    
+    for _ in range(targets["projectiles"] - len(game.projectiles)):
+        owner = rng.choice(["player", "enemy"])
+        game.projectile_system.spawn(left + rng.uniform(0, WIDTH), rng.uniform(50, HEIGHT - 100),
+                                     rng.uniform(-10, 10), rng.uniform(-5, 0), owner)
+    
+    for _ in range(targets["collectibles"] - len(game.collectibles)):
+        collectible_type = rng.choice(["coin", "health", "life"])
+        game.collectible_system.spawn(left + rng.uniform(0, WIDTH), rng.uniform(100, HEIGHT - 80), collectible_type)
+
+def run_stress_step(count, frames, seed, draw, mix=STRESS_MIX):
+    rng = random.Random(seed)
+    targets = {kind: int(count * share) for kind, share in mix.items()}
+    
+    # No rewind history, which would otherwise only be paid for when drawing
+    game = Game(headless=not draw, seed=seed, rewind=False)
+    game.state = PLAYING
+    
+    # Extra platforms go into a new list so cached platform arrays get rebuilt, and
+    # join the always-loaded ground so chunk streaming keeps them
+    extra = [Platform(rng.uniform(0, WIDTH * 2), rng.uniform(150, HEIGHT - 80), rng.choice([100, 150, 200]), 20)
+             for _ in range(targets["platforms"])]
+    game.platforms = game.platforms + extra
+    game.streamer.ground += extra
+    if game.background:
+        game.platform_changes.append(None)
     
-    # Update display
+    profiler = game.profiler
+    for frame in range(frames):
+        # Keep the player alive and the entity counts steady, outside the timed part
+        game.player.health = 100
+        game.player.lives = 3
+        fill_stress_game(game, targets, rng)
+        counts = game.entity_counts()
+        
+        profiler.frame_start = time.perf_counter()
+        game.handle_input(0)
+        game.update()
+        if draw:
+            game.draw()
+        profiler.end_frame(1, counts, SIM_DT)
+    
+    samples = list(profiler.samples)
+    def mean(key):
+        return sum(sample[key] for sample in samples) / len(samples)
+    entities = sum(targets.values())
+    return {
+        "count": count,
+        "entities": entities,
+        "targets": targets,
+        "frame_ms": mean("frame_ms"),
+        "update_ms": mean("update_ms"),
+        "physics_ms": mean("player_ms") + mean("projectiles_ms") + mean("enemies_ms") + mean("collectibles_ms"),
+        "streaming_ms": mean("streaming_ms"),
+        "collisions_ms": mean("collisions_ms"),
+        "draw_ms": mean("draw_ms"),
+        "background_ms": mean("background_ms"),
+        "entities_ms": mean("entities_ms"),
+        "hud_ms": mean("hud_ms"),
+        "p99_frame_ms": percentiles([sample["frame_ms"] / 1000 for sample in samples])["p99"],
+    }
+
+def run_stress(args):
+    # Spawns growing numbers of entities and reports ms per frame against entity count
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    draw = not args.no_draw
+    if draw:
+        init_display()
+    
+    seed = args.seed if args.seed is not None else 0
+    results = [run_stress_step(count, args.stress_frames, seed, draw, args.stress_mix) for count in args.stress]
+    
+    if args.json:
+        print(json.dumps({
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": host.python_version(),
+            "pygame": pygame.version.ver,
+            "machine": host.machine(),
+            "processor": host.processor(),
+            "frames": args.stress_frames,
+            "mix": args.stress_mix,
+            "results": results,
+        }, indent=2))
+        return
+    
+    if args.stress_mix != STRESS_MIX:
+        print("Per N: " + ", ".join(f"{kind} {share:g}" for kind, share in args.stress_mix.items()))
+    print(f"{'N':>6} {'entities':>8} {'frame':>8} {'physics':>8} {'stream':>7} {'collide':>8} {'draw':>8} "
+          f"{'bg':>7} {'sprites':>8} {'hud':>7} {'p99':>8}   (ms)")
+    for r in results:
+        print(f"{r['count']:>6} {r['entities']:>8} {r['frame_ms']:>8.3f} {r['physics_ms']:>8.3f} {r['streaming_ms']:>7.3f} "
+              f"{r['collisions_ms']:>8.3f} {r['draw_ms']:>8.3f} {r['background_ms']:>7.3f} "
+              f"{r['entities_ms']:>8.3f} {r['hud_ms']:>7.3f} {r['p99_frame_ms']:>8.3f}")
+    
+    # Where the 60 fps budget runs out
+    over = [r for r in results if r["frame_ms"] > SIM_DT * 1000]
+    if over:
+        print(f"Frame budget of {SIM_DT * 1000:.1f} ms first exceeded at N={over[0]['count']} ({over[0]['entities']} entities)")
+    else:
+        print(f"All steps fit in the {SIM_DT * 1000:.1f} ms frame budget")
+
+def chase_trial(level_file, target, offset, seed):
+    # One --chase-check run: the player stands on the middle of the target platform and
+    # a normal enemy starts on the ground offset px away. Returns the steps it took the
+    # enemy to stand on the player's platform, or None if it never did.
+    game = Game(headless=True, seed=seed, level_files=[level_file], rewind=False)
+    game.state = PLAYING
+    game.enemy_system.clear()
+    player = game.player
+    player.x = target.x + target.width / 2 - player.width / 2
+    player.y = target.y - player.height
+    ground_y = game.level_data.ground[0]
+    enemy = game.enemy_system.spawn(player.x + offset, ground_y - EnemySystem.HEIGHT, "normal")
+    
+    for step in range(CHASE_CHECK_STEPS):
+        # Nothing but the hunter may move the player or end the game
+        player.health = 100
+        player.hurt_timer = 10
+        game.handle_input(0)
+        game.update()
+        if enemy.index < 0:
+            return None
+        if (enemy.y + enemy.height == target.y and enemy.x < target.x + target.width and
+                enemy.x + enemy.width > target.x):
+            return step + 1
+    return None
+
+def run_chase_check(args):
+    # Checks that a normal enemy on the ground finds its way up to the player on every
+    # raised platform of the first chunk of each level that the navigation graph joins
+    # to the ground
+    failed = 0
+    for level_file in args.levels or LEVEL_FILES:
+        game = Game(headless=True, level_files=[level_file], rewind=False)
+        if not game.level_data.ground:
+            print(f"{level_file}: no ground to start from, skipped")
+            continue
+        ground = game.streamer.ground[0]
+        nav = NavGraph(game.platforms, EnemySystem.WIDTH, EnemySystem.HEIGHT)
+        width = game.level_width - EnemySystem.WIDTH
+        for index, target in enumerate(game.platforms):
+            if target is ground or target.x >= game.level_data.chunk_width:
+                continue
+            nav.set_target(index)
+            if nav.action[game.platforms.index(ground)] < 0:
+                print(f"{level_file} platform ({target.x}, {target.y}): no route from the ground")
+                continue
+            center = target.x + target.width / 2
+            offsets = [offset for offset in CHASE_CHECK_OFFSETS if 0 <= center + offset - 20 <= width]
+            steps = [chase_trial(level_file, target, offset, seed) for seed, offset in enumerate(offsets)]
+            reached = [step for step in steps if step is not None]
+            missed = len(steps) - len(reached)
+            failed += missed
+            slowest = f", slowest in {max(reached)} steps" if reached else ""
+            print(f"{level_file} platform ({target.x}, {target.y}): {len(reached)}/{len(steps)} reached{slowest}")
+    
+    if failed:
+        print(f"{failed} hunters didn't reach the player within {CHASE_CHECK_STEPS} steps")
+        sys.exit(1)
+    print("Every hunter reached the player")
+
+def scalar_trial(lists, arrays, script, steps, targets=None):
+    # One --scalar-check run: script played on two copies of a game, the second on numpy
+    # only. With targets, both are topped up to those counts every SCALAR_CHECK_REFILL
+    # steps so their entity counts keep crossing SCALAR_LIMIT. Returns the step after
+    # which their states first differ, or None, and the most enemies or projectiles seen
+    for system in (arrays.enemy_system, arrays.projectile_system, arrays.collectible_system):
+        system.SCALAR_LIMIT = 0
+    rngs = [random.Random(0), random.Random(0)]
+    most = 0
+    for step in range(steps):
+        if targets:
+            for game, rng in zip((lists, arrays), rngs):
+                game.player.health = 100
+                game.player.lives = 3
+                if step % SCALAR_CHECK_REFILL == 0:
+                    fill_stress_game(game, targets, rng)
+        inputs = script(step, lists)
+        for game in (lists, arrays):
+            game.handle_input(inputs)
+            game.update()
+        most = max(most, lists.enemy_system.count, lists.projectile_system.count)
+        if lists.save_state() != arrays.save_state():
+            return step + 1, most
+    return None, most
+
+def run_scalar_check(args):
+    # Replays each canned session and recording twice, with the plain-list paths for small
+    # entity counts and with numpy only, and checks save_state() agrees after every step.
+    # The two paths have to stay exact copies or replays and rewind silently break
+    trials = []
+    for name, recording in [(name, make_bench_recording(name)) for name in BENCH_SESSIONS] + \
+            [(path, Recording.load(path)) for path in args.scalar_check]:
+        games = [recording.new_game(headless=True, history=False) for _ in range(2)]
+        trials.append((name, games, lambda step, game, inputs=recording.inputs: inputs[step], len(recording.inputs), None))
+    
+    # A crowd of twice the limit that thins out, so games switch between the paths
+    games = [Game(headless=True, seed=1234, rewind=False) for _ in range(2)]
+    for game in games:
+        game.state = PLAYING
+    targets = {kind: int(EntityStore.SCALAR_LIMIT * share) for kind, share in STRESS_MIX.items()}
+    trials.append(("crowd", games, hunter_script, 1800, targets))
+    
+    failed = 0
+    for name, (lists, arrays), script, steps, targets in trials:
+        step, most = scalar_trial(lists, arrays, script, steps, targets)
+        if step is None:
+            print(f"{name}: {steps} steps match, up to {most} enemies or projectiles")
+        else:
+            failed += 1
+            print(f"{name}: differs after step {step}")
+    
+    if failed:
+        print(f"{failed} sessions differ between the plain-list and numpy paths")
+        sys.exit(1)
+    print(f"The plain-list paths (up to {EntityStore.SCALAR_LIMIT} entities) match numpy")
+
+def run_startup_probe():
+    # Starts up like run_game and stops after the first frame, printing how long each
+    # part took as JSON on the last line, for --startup-check
+    times = {}
+    t = time.perf_counter()
+    init_display()
+    times["display_ms"] = (time.perf_counter() - t) * 1000
+    
+    t = time.perf_counter()
+    game = Game()
+    SoundBank()
+    times["game_ms"] = (time.perf_counter() - t) * 1000
+    
+    t = time.perf_counter()
+    game.draw()
     pygame.display.flip()
+    times["first_frame_ms"] = (time.perf_counter() - t) * 1000
+    
+    pygame.quit()
+    print(json.dumps(times))
+
+def run_startup_check(args):
+    # Launches the game in fresh processes that quit after the first frame and checks the
+    # median time from launch to that frame, including Python and imports, against a target
+    target = args.startup_check
+    runs = []
+    for _ in range(STARTUP_RUNS):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), "--startup-probe"],
+                                capture_output=True, text=True, check=True)
+        total_ms = (time.perf_counter() - start) * 1000
+        times = json.loads(result.stdout.strip().splitlines()[-1])
+        times["total_ms"] = total_ms
+        times["python_imports_ms"] = total_ms - times["display_ms"] - times["game_ms"] - times["first_frame_ms"]
+        runs.append(times)
+    
+    def median(key):
+        values = sorted(run[key] for run in runs)
+        return values[len(values) // 2]
+    
+    keys = ["total_ms", "python_imports_ms", "display_ms", "game_ms", "first_frame_ms"]
+    if args.json:
+        print(json.dumps({"target_ms": target, "runs": runs, "median": {key: median(key) for key in keys}}, indent=2))
+    else:
+        print(f"Startup over {STARTUP_RUNS} launches, median (ms):")
+        for key in keys:
+            print(f"  {key[:-3]:<16} {median(key):8.1f}")
+    
+    if median("total_ms") > target:
+        print(f"Startup took {median('total_ms'):.0f} ms, over the {target} ms target")
+        sys.exit(1)
+    print(f"Startup is within the {target} ms target")
+
+def run_game(seed=None, record_path=None, recording=None, level_files=None, profile_path=None, threaded=False):
+    init_display()
+    
+    # Create game instance, a replay starts exactly where its recording did
+    if recording is not None:
+        game = recording.new_game()
+        replay_inputs = iter(recording.inputs)
+    else:
+        game = Game(seed=seed, level_files=level_files)
+    recorder = Recording(game.seed, level_files=game.level_files) if record_path else None
+    
+    # Main game loop
+    clock = pygame.time.Clock()
+    running = True
+    accumulator = 0.0
+    frame_time = 0.0
+    shoot_pressed = False  # F pressed since the last simulation step
+    start_pressed = False
+    quick_save = quick_load = False
+    
+    profiler = game.profiler
+    governor = QualityGovernor()
+    budget = 1 / (RENDER_FPS or 60)
+    sounds = SoundBank()
+    
+    # Threaded, the next frame is simulated while the last one's snapshot is drawn
+    simulation = SimulationThread(game) if threaded else None
+    
+    while running:
+        # The main thread only reads simulation state through the snapshot being drawn
+        frame = simulation.frame if simulation else game
+        
+        # Event handling
+        t = time.perf_counter()
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            
+            if event.type == pygame.KEYDOWN:
+                # Profiler overlay and export
+                if event.key == pygame.K_F3:
+                    profiler.visible = not profiler.visible
+                    game.last_draw = None
+                if event.key == pygame.K_F4:
+                    path = time.strftime("profile-%Y%m%d-%H%M%S.csv")
+                    print(f"Saved {profiler.export(path)} frames to {path}")
+                
+                # Quick save and load, a load can't be part of a recording or replay
+                if event.key == pygame.K_F5:
+                    quick_save = True
+                if event.key == pygame.K_F9:
+                    if recorder or recording is not None:
+                        print("Quick load is disabled while recording or replaying")
+                    else:
+                        quick_load = True
+                
+                if event.key == pygame.K_SPACE and frame.state == MENU:
+                    start_pressed = True
+                
+                if event.key == pygame.K_r and frame.state == GAME_OVER:
+                    start_pressed = True
+                
+                if event.key == pygame.K_f and frame.state == PLAYING:
+                    shoot_pressed = True
+        
+        profiler.add("events", t)
+        
+        # Run as many fixed simulation steps as the elapsed time calls for
+        accumulator += frame_time
+        steps = []  # INPUT_* bits for each step
+        while accumulator >= SIM_DT and len(steps) < MAX_STEPS_PER_FRAME:
+            t = time.perf_counter()
+            if recording is not None:
+                inputs = next(replay_inputs, None)
+                if inputs is None:
+                    running = False
+                    break
+            else:
+                inputs = read_keyboard()
+                if shoot_pressed:
+                    inputs |= INPUT_SHOOT
+                    shoot_pressed = False
+                if start_pressed:
+                    inputs |= INPUT_START
+                    start_pressed = False
+            if recorder:
+                recorder.record(inputs)
+            steps.append(inputs)
+            profiler.add("input", t)
+            accumulator -= SIM_DT
+        
+        # Too far behind to catch up, drop the backlog instead of spiralling
+        if len(steps) == MAX_STEPS_PER_FRAME:
+            accumulator = min(accumulator, SIM_DT)
+        
+        # The game isn't being simulated between steps, so it can be saved and loaded here
+        if quick_save:
+            t = time.perf_counter()
+            names = "\n".join(game.level_files).encode()
+            with open(QUICKSAVE_FILE, "wb") as f:
+                f.write(QUICKSAVE_HEADER.pack(QUICKSAVE_MAGIC, len(names)) + names + game.save_state())
+            print(f"Saved to {QUICKSAVE_FILE} in {(time.perf_counter() - t) * 1000:.2f} ms")
+            quick_save = False
+        if quick_load:
+            t = time.perf_counter()
+            data = b""
+            if os.path.exists(QUICKSAVE_FILE):
+                with open(QUICKSAVE_FILE, "rb") as f:
+                    data = f.read()
+            if not data.startswith(QUICKSAVE_MAGIC):
+                print(f"No quick save in {QUICKSAVE_FILE}")
+            else:
+                # A save only fits the levels it was made on
+                names_size = QUICKSAVE_HEADER.unpack_from(data)[1]
+                offset = QUICKSAVE_HEADER.size + names_size
+                level_files = data[QUICKSAVE_HEADER.size:offset].decode().split("\n")
+                if level_files != game.level_files:
+                    print(f"{QUICKSAVE_FILE} was saved on other levels ({', '.join(level_files)})")
+                else:
+                    game.load_state(data[offset:])
+                    game.history.clear()
+                    print(f"Loaded {QUICKSAVE_FILE} in {(time.perf_counter() - t) * 1000:.2f} ms")
+            quick_load = False
+        
+        if simulation:
+            simulation.submit(steps)
+        else:
+            game.run_steps(steps)
+        
+        # Draw everything, interpolated between the last two steps. The profiler
+        # overlay sits on top, so it needs full repaints while visible. Threaded,
+        # this is the previous frame's snapshot and rendering runs one frame behind.
+        if profiler.visible:
+            game.last_draw = None
+        dirty = game.draw(accumulator / SIM_DT, frame if simulation else None)
+        if profiler.visible:
+            profiler.draw(screen, [governor.describe(budget)])
+        
+        # Update display
+        t = time.perf_counter()
+        if dirty is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(dirty)
+        profiler.add("display", t)
+        
+        # Sounds asked for by the simulation up to the frame just drawn
+        sounds.play_all(frame.sound_events)
+        frame.sound_events = []
+        
+        # Hand over: wait for the simulated frame, the game is ours again until the next submit
+        if simulation:
+            simulation.collect()
+        
+        # Drop or restore detail to keep the work for a frame within the budget. Drawing
+        # at another level changes the whole screen.
+        if governor.update(time.perf_counter() - profiler.frame_start, budget):
+            game.quality = governor.level
+            game.last_draw = None
+        
+        # Cap the frame rate (0 leaves it uncapped) and measure the real frame time
+        frame_time = clock.tick(RENDER_FPS) / 1000
+        profiler.end_frame(len(steps), dict(game.entity_counts(), quality=game.quality), budget)
+    
+    if simulation:
+        simulation.stop()
+    
+    if recorder:
+        recorder.checksum = game.state_checksum()
+        recorder.save(record_path)
+        print(f"Recorded {len(recorder.inputs)} steps to {record_path}")
+    if recording is not None:
+        matched = game.state_checksum() == recording.checksum
+        print("Replay matched the recording" if matched else "Replay DIVERGED from the recording")
+    
+    if profile_path:
+        print(f"Saved {profiler.export(profile_path)} frames to {profile_path}")
+    
+    pygame.quit()
+
+def main():
+    global DIRTY_RECTS, RENDER_FPS
+    
+    parser = argparse.ArgumentParser(description="Animal Hero vs Human Enemies")
+    parser.add_argument("--fps", type=int, default=60, help="render frame rate cap, 0 for uncapped")
+    parser.add_argument("--dirty-rects", action="store_true", help="only update the parts of the screen that changed")
+    parser.add_argument("--threaded", action="store_true",
+                        help="simulate the next frame on a worker thread while the current one is drawn")
+    parser.add_argument("--headless", action="store_true", help="run scripted games without a window and report the outcomes")
+    parser.add_argument("--runs", type=int, default=8, help="number of headless games")
+    parser.add_argument("--frames", type=int, default=3600, help="frame limit for each headless game")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes used for headless games")
+    parser.add_argument("--seed", type=int, default=None, help="random seed (first seed for headless games)")
+    parser.add_argument("--script", choices=sorted(SCRIPTS), default="hunter", help="input script for headless games")
+    parser.add_argument("--levels", metavar="FILE", nargs="+", help="level files to play instead of the built-in three")
+    parser.add_argument("--record", metavar="FILE", help="record the session's inputs to FILE")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="play back a recorded session on the levels it was recorded on (headless with --headless)")
+    parser.add_argument("--bench-replay", metavar="FILE", nargs="*",
+                        help="time update/draw while replaying the canned sessions and any given recordings")
+    parser.add_argument("--bench-rewind", action="store_true",
+                        help="time rewind snapshots and restores over the canned sessions and report their memory")
+    parser.add_argument("--json", action="store_true", help="print benchmark results as JSON")
+    parser.add_argument("--profile-out", metavar="FILE", help="save per-frame profiler samples to FILE (.csv or .json) on exit")
+    parser.add_argument("--stress", metavar="N", type=int, nargs="*",
+                        help="stress test with N of each entity kind (scaled by --stress-mix) for each N given")
+    parser.add_argument("--stress-mix", metavar="KIND=SHARE,...", type=stress_mix, default=dict(STRESS_MIX),
+                        help="how many of each kind the stress test spawns per N, any left out keep their default "
+                             f"({','.join(f'{kind}={share:g}' for kind, share in STRESS_MIX.items())})")
+    parser.add_argument("--stress-frames", type=int, default=300, help="frames timed for each stress test step")
+    parser.add_argument("--no-draw", action="store_true", help="only time update in the stress test")
+    parser.add_argument("--startup-check", metavar="MS", type=int, nargs="?", const=STARTUP_TARGET_MS,
+                        help=f"time launch to first frame and fail if over MS (default {STARTUP_TARGET_MS})")
+    parser.add_argument("--startup-probe", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--chase-check", action="store_true",
+                        help="check normal enemies on the ground reach the player on raised platforms (levels from --levels)")
+    parser.add_argument("--scalar-check", metavar="FILE", nargs="*",
+                        help="check the plain-list paths for small entity counts match numpy step for step, "
+                             "over the canned sessions and any given recordings")
+    args = parser.parse_args()
+    
+    DIRTY_RECTS = args.dirty_rects
+    RENDER_FPS = args.fps
     
-    # Cap the frame rate
-    clock.tick(60)
+    if args.startup_probe:
+        run_startup_probe()
+    elif args.chase_check:
+        run_chase_check(args)
+    elif args.scalar_check is not None:
+        run_scalar_check(args)
+    elif args.startup_check is not None:
+        run_startup_check(args)
+    elif args.stress is not None:
+        if not args.stress:
+            args.stress = [0, 10, 50, 100, 250, 500, 1000]
+        run_stress(args)
+    elif args.bench_rewind:
+        run_rewind_bench(args)
+    elif args.bench_replay is not None:
+        run_replay_bench(args)
+    elif args.replay and args.headless:
+        game, matched = replay(Recording.load(args.replay))
+        print(f"Replayed {args.replay}: {'matched' if matched else 'DIVERGED'}, score {game.player.score}, level {min(game.level, game.level_count)}")
+        if not matched:
+            sys.exit(1)
+    elif args.headless:
+        if args.seed is None:
+            args.seed = 0
+        run_headless(args)
+    elif args.replay:
+        run_game(recording=Recording.load(args.replay), threaded=args.threaded)
+    else:
+        run_game(seed=args.seed, record_path=args.record, level_files=args.levels, profile_path=args.profile_out,
+                 threaded=args.threaded)
+    sys.exit()
 
-pygame.quit()
-sys.exit()
\ No newline at end of file
+if __name__ == "__main__":
+    main()